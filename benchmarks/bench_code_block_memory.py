@@ -0,0 +1,63 @@
+"""
+Memory use over many conversions that store code blocks, to check that
+`publish_xaml_ex` doesn't keep anything from one conversion to the next.
+
+Run from the root of the repository::
+
+    python -m benchmarks.bench_code_block_memory [conversions]
+
+The resident set size is read from ``/proc/self/statm`` (so this needs
+Linux) and printed every 1000 conversions. It should stay flat.
+"""
+
+import gc
+import resource
+import sys
+import time
+
+# This installs the pygments directive
+import xamlwriter.register_directive
+
+from xamlwriter.writer import publish_xaml_ex
+
+
+SOURCE = u'''\
+Code blocks
+===========
+
+.. code-block:: python
+
+    def function(arg):
+        return arg * %(number)d
+
+.. code-block:: pycon
+
+    >>> function(%(number)d)
+    %(number)d
+
+Some text after the code.
+'''
+
+
+def current_rss():
+    # kilobytes
+    pages = int(open('/proc/self/statm').read().split()[1])
+    return pages * resource.getpagesize() // 1024
+
+
+def main(args):
+    conversions = int(args[0]) if args else 10000
+    print '%12s %12s %12s' % ('conversions', 'RSS (KB)', 'time (s)')
+    start = time.time()
+    for number in xrange(1, conversions + 1):
+        xaml, code_blocks = publish_xaml_ex(SOURCE % {'number': number},
+                                            flowdocument=False)
+        assert len(code_blocks) == 2
+        if number % 1000 == 0:
+            gc.collect()
+            print '%12d %12d %12.1f' % (number, current_rss(), time.time() - start)
+    print 'Module level code_blocks: %d' % len(xamlwriter.register_directive.code_blocks)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,149 @@
+"""
+Time spent highlighting a snippet-heavy tutorial, comparing a new lexer and
+`XamlFormatter` for every code block with the cached ones from
+`xamlwriter.highlight`, and with the cache of highlighted results.
+
+Run from the root of the repository::
+
+    python -m benchmarks.bench_code_blocks [number of snippets]
+"""
+
+import sys
+import time
+
+from pygments import highlight
+from pygments.lexers import get_lexer_by_name
+
+# This installs the pygments directive
+import xamlwriter.register_directive
+
+from xamlwriter import highlight as highlight_module
+from xamlwriter.highlight import HighlightCache, highlight_code
+from xamlwriter.writer import publish_xaml
+from xamlwriter.xamlformatter import XamlFormatter
+
+
+SNIPPETS = [
+    ('python', u'x = %d'),
+    ('pycon', u'>>> print x + %d\n42'),
+    ('python', u'def f(arg):\n    return arg * %d'),
+    ('html', u'<p class="note">%d</p>'),
+]
+
+
+def make_snippets(count):
+    snippets = []
+    for number in range(count):
+        language, code = SNIPPETS[number % len(SNIPPETS)]
+        snippets.append((language, code % number))
+    return snippets
+
+
+def make_tutorial(snippets):
+    parts = []
+    for language, code in snippets:
+        parts.append(u'Some explanation of the next snippet.\n\n'
+                     u'.. code-block:: %s\n\n    %s\n\n'
+                     % (language, code.replace(u'\n', u'\n    ')))
+    return u''.join(parts)
+
+
+def make_listing(lines):
+    code = [u'class Generated%d(object):\n'
+            u'    def method(self, arg=%d):\n'
+            u'        # a comment\n'
+            u'        return "<%%s>" %% (arg + self.value * 2.5)\n\n']
+    return u''.join(code[0] % (number, number) for number in range(lines // 5))
+
+
+class NullFile(object):
+
+    def write(self, data):
+        pass
+
+
+def uncached(snippets, flowdocument):
+    for language, code in snippets:
+        XamlFormatter.style_tables.clear()
+        lexer = get_lexer_by_name(language)
+        formatter = XamlFormatter(flowdocument=flowdocument)
+        highlight(code, lexer, formatter)
+
+
+def cached(snippets, flowdocument):
+    old_cache = highlight_module.highlight_cache
+    highlight_module.highlight_cache = None
+    try:
+        for language, code in snippets:
+            highlight_code(language, code, flowdocument=flowdocument)
+    finally:
+        highlight_module.highlight_cache = old_cache
+
+
+def memoized(snippets, flowdocument):
+    # the snippets repeat, as they do across the pages of a tutorial
+    old_cache = highlight_module.highlight_cache
+    cache = highlight_module.highlight_cache = HighlightCache()
+    try:
+        for language, code in snippets:
+            highlight_code(language, code, flowdocument=flowdocument)
+    finally:
+        highlight_module.highlight_cache = old_cache
+    return cache
+
+
+def best_time(function, *args):
+    times = []
+    for _ in range(5):
+        start = time.time()
+        function(*args)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main(args):
+    count = int(args[0]) if args else 500
+    snippets = make_snippets(count)
+    # the same snippets repeated, as they are across the pages of a tutorial
+    repeated = snippets[:count // 10] * 10
+    print 'Snippets: %d' % count
+    print '%-12s %-10s %-10s %10s %16s' % ('mode', 'snippets', 'setup',
+                                           'time (s)', 'per snippet (us)')
+    for flowdocument, mode in ((True, 'FlowDocument'), (False, 'Silverlight')):
+        for function, name, data, kind in (
+                (uncached, 'new', snippets, 'unique'),
+                (cached, 'cached', snippets, 'unique'),
+                (cached, 'cached', repeated, 'repeated'),
+                (memoized, 'memoized', repeated, 'repeated')):
+            elapsed = best_time(function, data, flowdocument)
+            print '%-12s %-10s %-10s %10.3f %16.1f' % (mode, kind, name, elapsed,
+                                                       elapsed / count * 1e6)
+    
+    cache = memoized(repeated, True)
+    print
+    print 'Result cache for the repeated snippets: %d hits, %d misses' % (
+        cache.hits, cache.misses)
+    
+    listing = make_listing(count * 20)
+    tokens = list(get_lexer_by_name('python').get_tokens(listing))
+    formatter = XamlFormatter()
+    elapsed = best_time(formatter.format, tokens, NullFile())
+    print
+    print 'Formatting a %d line listing (%d tokens): %.3fs' % (
+        count * 20, len(tokens), elapsed)
+    
+    # generated code can put a whole table on one line
+    line = u'table = [%s]\n' % (u'"cell", 1, ' * (count * 4))
+    tokens = list(get_lexer_by_name('python').get_tokens(line))
+    elapsed = best_time(formatter.format, tokens, NullFile())
+    print 'Formatting a single %d character line (%d tokens): %.3fs' % (
+        len(line), len(tokens), elapsed)
+    
+    tutorial = make_tutorial(snippets)
+    elapsed = best_time(publish_xaml, tutorial)
+    print
+    print 'publish_xaml of the whole tutorial: %.3fs' % elapsed
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,127 @@
+"""
+Per-node dispatch overhead of `XamlTranslator`, comparing the precompiled
+dispatch table with looking up the visitor method by name for every node.
+
+Run from the root of the repository::
+
+    python -m benchmarks.bench_dispatch [number of nodes]
+"""
+
+import sys
+import time
+
+from docutils import nodes
+from docutils.nodes import SkipNode
+from docutils.utils import new_document
+
+from xamlwriter.translator import XamlTranslator
+
+
+class NameLookupTranslator(XamlTranslator):
+    """Dispatches the way `XamlTranslator` did before the dispatch table."""
+
+    def dispatch_visit(self, node):
+        node_name = node.__class__.__name__
+        if node_name == 'Text':
+            self.add_text(node.astext())
+            raise SkipNode
+            
+        tagname, atts = self.trivial_nodes.get(node_name, (None, None))
+        if tagname:
+            self.begin_node(node, tagname, **atts)
+        else:
+            getattr(self, 'visit_' + node_name, self.unknown_visit)(node)
+
+    def dispatch_departure(self, node):
+        node_name = node.__class__.__name__
+        
+        tagname, atts = self.trivial_nodes.get(node_name, (None, None))
+        if tagname:
+            self.end_node()
+        else:
+            getattr(self, 'depart_' + node_name, self.unknown_departure)(node)
+
+
+class NullOutput(object):
+    """Makes the translator produce no output, leaving only dispatch."""
+
+    def begin_node(self, node, tagname, **more_attributes):
+        pass
+
+    def end_node(self):
+        pass
+
+    def add_text(self, text, escape=True):
+        pass
+
+
+def make_doctree(size):
+    """Build a doctree of at least `size` nodes out of inline markup."""
+    document = new_document('<benchmark>')
+    count = 1
+    while count < size:
+        document.append(nodes.paragraph('', '',
+            nodes.Text('Some text with '),
+            nodes.emphasis('', 'emphasis'),
+            nodes.Text(', '),
+            nodes.strong('', 'strong'),
+            nodes.Text(' and '),
+            nodes.literal('', 'literal'),
+        ))
+        count += 10
+    return document, count
+
+
+def dispatch_all(visitor, node_list):
+    visit = visitor.dispatch_visit
+    depart = visitor.dispatch_departure
+    for node in node_list:
+        try:
+            visit(node)
+        except SkipNode:
+            continue
+        depart(node)
+
+
+def best_time(function, *args):
+    times = []
+    for _ in range(15):
+        start = time.time()
+        function(*args)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main(args):
+    size = int(args[0]) if args else 100000
+    document, count = make_doctree(size)
+    node_list = list(document.traverse())
+    print 'Doctree nodes: %d' % count
+    print
+    print 'Dispatch only (translator output disabled):'
+    print '%-12s %-16s %10s %14s' % ('mode', 'dispatch', 'time (s)', 'per node (us)')
+    for flowdocument, mode in ((True, 'FlowDocument'), (False, 'Silverlight')):
+        for translator_class, name in ((NameLookupTranslator, 'name lookup'),
+                                       (XamlTranslator, 'dispatch table')):
+            null_class = type('Null' + translator_class.__name__,
+                              (NullOutput, translator_class), {})
+            visitor = null_class(document, flowdocument=flowdocument)
+            elapsed = best_time(dispatch_all, visitor, node_list)
+            print '%-12s %-16s %10.3f %14.2f' % (mode, name, elapsed,
+                                                 elapsed / count * 1e6)
+    print
+    print 'Full walkabout:'
+    print '%-12s %-16s %10s %14s' % ('mode', 'dispatch', 'time (s)', 'per node (us)')
+    for flowdocument, mode in ((True, 'FlowDocument'), (False, 'Silverlight')):
+        for translator_class, name in ((NameLookupTranslator, 'name lookup'),
+                                       (XamlTranslator, 'dispatch table')):
+            def walk():
+                document.walkabout(translator_class(document,
+                                                    flowdocument=flowdocument))
+            elapsed = best_time(walk)
+            print '%-12s %-16s %10.3f %14.2f' % (mode, name, elapsed,
+                                                 elapsed / count * 1e6)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,88 @@
+"""
+Cost of escaping text for XAML, comparing the chained replace escaping
+`escape_xaml` used to do with the current one, over the text nodes of a
+generated document and the pygments tokens of this package's own source.
+
+Run from the root of the repository::
+
+    python -m benchmarks.bench_escape [document size in KB]
+"""
+
+import glob
+import os
+import sys
+import time
+
+from docutils import nodes
+from docutils.core import publish_doctree
+from pygments.lexers import PythonLexer
+
+import xamlwriter
+from xamlwriter.utils import escape_xaml, escape_xaml_nbsp
+
+from benchmarks.corpus import make_document
+
+
+def chained_escape(text):
+    """`escape_xaml` before the fast path."""
+    return text.replace('&', '&amp;').  \
+                replace('<', '&lt;').   \
+                replace('>', '&gt;').   \
+                replace('"', '&quot;'). \
+                replace("'", '&apos;')
+
+
+def chained_escape_nbsp(text, nbsp='&#160;'):
+    return chained_escape(text).replace(' ', nbsp)
+
+
+def document_text(size):
+    document = publish_doctree(make_document(size),
+                               settings_overrides={'report_level': 5})
+    return [node.astext() for node in document.traverse(nodes.Text)]
+
+
+def source_tokens():
+    package = os.path.dirname(xamlwriter.__file__)
+    lexer = PythonLexer()
+    tokens = []
+    for path in sorted(glob.glob(os.path.join(package, '*.py'))):
+        source = open(path).read().decode('utf-8')
+        tokens.extend(value for ttype, value in lexer.get_tokens(source))
+    return tokens
+
+
+def escape_all(escape, texts):
+    for text in texts:
+        escape(text)
+
+
+def best_time(function, *args):
+    times = []
+    for _ in range(15):
+        start = time.time()
+        function(*args)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main(args):
+    size = int(args[0]) if args else 200
+    samples = [('document text', document_text(size * 1024)),
+               ('pygments tokens', source_tokens())]
+
+    print '%-16s %8s %9s %-18s %10s %15s' % ('input', 'strings', 'escaped',
+        'escape', 'time (s)', 'per string (us)')
+    for name, texts in samples:
+        escaped = len([text for text in texts if chained_escape(text) != text])
+        for escape, label in ((chained_escape, 'chained'),
+                              (escape_xaml, 'escape_xaml'),
+                              (chained_escape_nbsp, 'chained + nbsp'),
+                              (escape_xaml_nbsp, 'escape_xaml_nbsp')):
+            elapsed = best_time(escape_all, escape, texts)
+            print '%-16s %8d %9d %-18s %10.4f %15.3f' % (name, len(texts),
+                escaped, label, elapsed, elapsed / len(texts) * 1e6)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,201 @@
+"""
+Peak memory of `publish_xaml` against the size of the reST input, for
+sizing the machines that run conversions.
+
+Run from the root of the repository::
+
+    python -m benchmarks.bench_memory_scaling [options] [sizes in KB]
+
+The default sizes go from 10 KB to 50 MB; the largest take many minutes.
+Each size is converted in a separate process, so the peak resident set
+size (from `resource.getrusage`) of one conversion doesn't hide the next.
+The resident set size before the conversion is read from
+``/proc/self/statm``, so this needs Linux. For each size it prints the peak RSS, how much of
+it the conversion added, and a census of the XAML node tree: the number of
+objects and the bytes they take (from `sys.getsizeof`) per class, including
+the `OrderedDict` attributes of `Node` and the attribute tuples of
+`CompactNode`, counted once however many nodes share them.
+
+With ``--csv FILE`` the size against memory curve is written to FILE as
+well. ``--streaming`` measures the streaming conversion instead, which
+doesn't build a node tree (so there is no census), and ``--node-class
+Node`` builds the tree from `Node` rather than `CompactNode`.
+"""
+
+import gc
+import resource
+import subprocess
+import sys
+import time
+
+from optparse import OptionParser
+
+from docutils.core import publish_string
+
+# This installs the pygments directive
+import xamlwriter.register_directive
+
+from benchmarks.corpus import make_document
+# the class xamlwriter.node uses, which may be from the odict package
+from xamlwriter.node import CompactNode, Node, OrderedDict, TextNode
+from xamlwriter.translator import XamlTranslator
+from xamlwriter.writer import XamlWriter, get_config, publish_xaml
+
+
+SIZES = [10, 100, 1024, 10 * 1024, 50 * 1024]
+
+NODE_CLASSES = {
+    'Node': Node,
+    'CompactNode': CompactNode,
+}
+
+CENSUS_CLASSES = ('CompactNode', 'Node', 'TextNode', 'OrderedDict',
+                  'attribute tuple')
+
+
+class NullFile(object):
+
+    def write(self, data):
+        pass
+
+
+def peak_rss():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def current_rss():
+    # kilobytes
+    pages = int(open('/proc/self/statm').read().split()[1])
+    return pages * resource.getpagesize() // 1024
+
+
+def census(root):
+    """
+    Return a dictionary of class name to [objects, bytes] for the XAML node
+    tree `root`. The bytes of a node include its children list.
+    """
+    counts = dict((name, [0, 0]) for name in CENSUS_CLASSES)
+    def add(name, size):
+        entry = counts[name]
+        entry[0] += 1
+        entry[1] += size
+
+    seen = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, TextNode):
+            add('TextNode', sys.getsizeof(node) + sys.getsizeof(node.data))
+            continue
+        size = sys.getsizeof(node)
+        if node.children:
+            size += sys.getsizeof(node.children)
+        if isinstance(node, CompactNode):
+            add('CompactNode', size)
+            pairs = node.attribute_pairs
+            if pairs and id(pairs) not in seen:
+                seen.add(id(pairs))
+                add('attribute tuple', sys.getsizeof(pairs) +
+                    sum(sys.getsizeof(pair) for pair in pairs))
+        else:
+            add('Node', size)
+            if isinstance(node.attributes, OrderedDict):
+                size = sys.getsizeof(node.attributes)
+                # the key order list of the bundled odict
+                sequence = getattr(node.attributes, '_sequence', None)
+                if sequence is not None:
+                    size += sys.getsizeof(sequence)
+                add('OrderedDict', size)
+        stack.extend(node.children)
+    return counts
+
+
+def measure(size, class_name, streaming):
+    """
+    Convert a document of `size` bytes and print the measurements on one
+    line, for `main` to read.
+    """
+    source = make_document(size)
+    gc.collect()
+    before = current_rss()
+    start = time.time()
+    if streaming:
+        publish_xaml(source, streaming=True, outfile=NullFile())
+        counts = {}
+    else:
+        # this process only does this one conversion
+        XamlTranslator.node_class = NODE_CLASSES[class_name]
+        # what publish_xaml does, but keeping the translator for the census
+        translator = publish_string(source=source, writer=XamlWriter(),
+                                    settings_overrides=get_config())
+        translator.root.to_string()
+        counts = census(translator.root)
+    elapsed = time.time() - start
+    fields = [len(source), before, peak_rss(), elapsed]
+    for name in CENSUS_CLASSES:
+        fields.extend(counts.get(name, (0, 0)))
+    print ' '.join(str(field) for field in fields)
+
+
+def make_parser():
+    parser = OptionParser(
+        usage='python -m benchmarks.bench_memory_scaling [options] [KB ...]')
+    parser.add_option('--csv', metavar='FILE',
+                      help='write the size against memory curve to FILE')
+    parser.add_option('--streaming', action='store_true', default=False,
+                      help='measure the streaming conversion')
+    parser.add_option('--node-class', default='CompactNode',
+                      choices=sorted(NODE_CLASSES),
+                      help='the class of the XAML nodes (default CompactNode)')
+    return parser
+
+
+def main(argv):
+    if argv[:1] == ['--child']:
+        measure(int(argv[1]), argv[2], argv[3] == 'streaming')
+        return
+    options, args = make_parser().parse_args(argv)
+    sizes = [int(arg) for arg in args] or SIZES
+
+    columns = ['reST (KB)', 'base RSS (KB)', 'peak RSS (KB)', 'added (KB)',
+               'per input KB', 'time (s)']
+    print ' '.join('%14s' % column for column in columns)
+    rows = []
+    for kilobytes in sizes:
+        mode = 'streaming' if options.streaming else 'tree'
+        output = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.bench_memory_scaling',
+             '--child', str(kilobytes * 1024), options.node_class, mode],
+            stdout=subprocess.PIPE).communicate()[0]
+        fields = output.split()
+        length, before, peak = [int(field) for field in fields[:3]]
+        elapsed = float(fields[3])
+        counts = [int(field) for field in fields[4:]]
+        added = peak - before
+        print '%14d %14d %14d %14d %14.2f %14.2f' % (length // 1024, before,
+            peak, added, added / (length / 1024.0), elapsed)
+        for index, name in enumerate(CENSUS_CLASSES):
+            objects, size = counts[index * 2:index * 2 + 2]
+            if objects:
+                print '    %-16s %10d objects %12d KB' % (name, objects,
+                                                          size // 1024)
+        rows.append([length, before, peak, added, elapsed] + counts)
+
+    if options.csv:
+        header = ['rest_bytes', 'base_rss_kb', 'peak_rss_kb', 'added_kb',
+                  'seconds']
+        for name in CENSUS_CLASSES:
+            name = name.replace(' ', '_')
+            header.extend([name + '_objects', name + '_bytes'])
+        handle = open(options.csv, 'w')
+        try:
+            handle.write(','.join(header) + '\n')
+            for row in rows:
+                handle.write(','.join(str(field) for field in row) + '\n')
+        finally:
+            handle.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
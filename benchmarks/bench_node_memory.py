@@ -0,0 +1,74 @@
+"""
+Peak memory used by the XAML node tree, comparing `Node` with `CompactNode`.
+
+Run from the root of the repository::
+
+    python -m benchmarks.bench_node_memory [size in MB]
+
+Each node class is measured in a separate process, so the peak resident set
+size (from `resource.getrusage`) of one run doesn't hide the other.
+"""
+
+import gc
+import resource
+import subprocess
+import sys
+import time
+
+from docutils.core import publish_doctree
+
+# This installs the pygments directive
+import xamlwriter.register_directive
+
+from benchmarks.corpus import make_document
+from xamlwriter.node import CompactNode, Node
+from xamlwriter.translator import XamlTranslator
+from xamlwriter.writer import settings_overrides
+
+
+NODE_CLASSES = {
+    'Node': Node,
+    'CompactNode': CompactNode,
+}
+
+
+def peak_rss():
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(class_name, size):
+    class Translator(XamlTranslator):
+        node_class = NODE_CLASSES[class_name]
+
+    doctree = publish_doctree(make_document(size),
+                              settings_overrides=settings_overrides)
+    gc.collect()
+    before = peak_rss()
+    start = time.time()
+    visitor = Translator(doctree)
+    doctree.walkabout(visitor)
+    elapsed = time.time() - start
+    after = peak_rss()
+    print '%s %d %d %f' % (class_name, before, after, elapsed)
+
+
+def main(args):
+    if args[:1] == ['--child']:
+        measure(args[1], int(args[2]))
+        return
+    size = int(float(args[0]) * 1024 * 1024) if args else 5 * 1024 * 1024
+    print 'Document size: %d bytes' % size
+    print '%-12s %14s %14s %10s' % ('node class', 'tree (KB)', 'peak RSS (KB)', 'time (s)')
+    for class_name in ('Node', 'CompactNode'):
+        output = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.bench_node_memory',
+             '--child', class_name, str(size)],
+            stdout=subprocess.PIPE).communicate()[0]
+        name, before, after, elapsed = output.split()
+        print '%-12s %14d %14d %10.2f' % (name, int(after) - int(before),
+                                          int(after), float(elapsed))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
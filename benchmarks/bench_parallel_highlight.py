@@ -0,0 +1,61 @@
+"""
+Time to convert a batch of code heavy documents with the code blocks
+highlighted by the directive while parsing, and highlighted after parsing
+by a pool of processes (see `xamlwriter.highlight.highlight_code_blocks`).
+
+Run from the root of the repository::
+
+    python -m benchmarks.bench_parallel_highlight [documents] [jobs ...]
+
+The highlighting can only scale with the number of cores the machine has.
+The cache of highlighted XAML is switched off and every code block in the
+batch is different.
+"""
+
+import multiprocessing
+import sys
+import time
+
+# This installs the pygments directive
+import xamlwriter.register_directive
+
+from xamlwriter import highlight as highlight_module
+from xamlwriter.highlight import highlight_code_blocks
+from xamlwriter.writer import get_doctree, publish_xaml, write_doctree
+
+from benchmarks.corpus import make_corpus
+
+
+def convert_serially(sources):
+    return [publish_xaml(source) for source in sources]
+
+
+def convert_with_pool(sources, jobs):
+    documents = [get_doctree(source) for source in sources]
+    highlight_code_blocks(documents, jobs=jobs)
+    return [write_doctree(document) for document in documents]
+
+
+def main(args):
+    count = int(args[0]) if args else 10
+    jobs = [int(arg) for arg in args[1:]] or sorted(
+        set([1, 2, multiprocessing.cpu_count()]))
+    # make every code block in the batch different
+    sources = [make_corpus(paragraphs=10, code_blocks=50, code_lines=30,
+                           seed=seed).replace(u'value_', u'doc%d_' % seed)
+               for seed in range(count)]
+
+    highlight_module.highlight_cache = None
+    print '%d documents, %d CPUs' % (count, multiprocessing.cpu_count())
+    print '%-24s %10s' % ('highlighting', 'time (s)')
+    start = time.time()
+    expected = convert_serially(sources)
+    print '%-24s %10.2f' % ('while parsing', time.time() - start)
+    for number in jobs:
+        start = time.time()
+        assert convert_with_pool(sources, number) == expected
+        print '%-24s %10.2f' % ('after, %d jobs' % number, time.time() - start)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
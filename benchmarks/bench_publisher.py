@@ -0,0 +1,55 @@
+"""
+Per call cost of converting many small documents with `publish_xaml`, which
+sets docutils up for every call, and with a long-lived `XamlPublisher`.
+
+Run from the root of the repository::
+
+    python -m benchmarks.bench_publisher [conversions] [document size in KB]
+
+The empty document shows the fixed overhead of a call on its own.
+"""
+
+import sys
+import time
+
+# This installs the pygments directive
+import xamlwriter.register_directive
+
+from xamlwriter.writer import XamlPublisher, publish_xaml
+
+from benchmarks.corpus import make_document
+
+
+def convert_all(convert, sources):
+    start = time.time()
+    for source in sources:
+        convert(source)
+    return time.time() - start
+
+
+def main(args):
+    conversions = int(args[0]) if args else 1000
+    size = int(args[1]) if len(args) > 1 else 1
+    documents = [('empty', u''), ('%d KB' % size, make_document(size * 1024))]
+
+    print '%-10s %-14s %12s %14s' % ('document', 'mode', 'time (s)',
+                                     'per call (ms)')
+    for flowdocument, mode in ((True, 'FlowDocument'), (False, 'Silverlight')):
+        publisher = XamlPublisher(flowdocument=flowdocument)
+        for name, source in documents:
+            assert publisher.publish(source) == publish_xaml(
+                source, flowdocument=flowdocument)
+            sources = [source] * conversions
+            for label, convert in (
+                    ('publish_xaml', lambda source: publish_xaml(
+                        source, flowdocument=flowdocument)),
+                    ('XamlPublisher', publisher.publish)):
+                elapsed = convert_all(convert, sources)
+                print '%-10s %-14s %12.2f %14.3f' % (name, label, elapsed,
+                    elapsed / conversions * 1000)
+        print mode
+        print
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
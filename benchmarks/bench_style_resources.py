@@ -0,0 +1,42 @@
+"""
+Size of the XAML for generated documents, with the styles repeated on every
+element and with them defined once as style resources: the text styles for
+Silverlight, and the pygments token styles of the code blocks for
+FlowDocument.
+
+Run from the root of the repository::
+
+    python -m benchmarks.bench_style_resources [document sizes in KB]
+"""
+
+import sys
+
+# This installs the pygments directive
+import xamlwriter.register_directive
+
+from xamlwriter.writer import publish_xaml
+
+from benchmarks.corpus import make_document
+
+
+def xaml_size(source, flowdocument, style_resources):
+    xaml = publish_xaml(source, flowdocument=flowdocument,
+                        style_resources=style_resources)
+    return len(xaml.encode('utf-8'))
+
+
+def main(args):
+    sizes = [int(arg) for arg in args] or [1, 10, 100, 1000]
+    print '%-12s %10s %14s %14s %14s %8s' % ('mode', 'reST (KB)',
+        'plain (bytes)', 'styles (bytes)', 'saved (bytes)', 'saved')
+    for flowdocument, mode in ((False, 'Silverlight'), (True, 'FlowDocument')):
+        for size in sizes:
+            source = make_document(size * 1024)
+            plain = xaml_size(source, flowdocument, False)
+            styled = xaml_size(source, flowdocument, True)
+            print '%-12s %10d %14d %14d %14d %7.1f%%' % (mode, size, plain,
+                styled, plain - styled, 100.0 * (plain - styled) / plain)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,120 @@
+"""
+Synthetic reST documents for the benchmarks.
+"""
+
+SECTION = u'''\
+Section %(number)d
+==========================
+
+A paragraph with *italic* and **bold** text, an ``inline literal`` and
+some more words to fill the line out to a realistic length. Paragraph
+number %(number)d goes on for a second sentence as well.
+
+| A line block
+| where newlines are preserved
+
+    A block quote with a little text in it.
+
+* A bullet list
+* The second item with *emphasis*
+* The third item
+
+#. An enumerated list
+#. again
+
+A literal block::
+
+    def function(arg, arg2=None):
+        return arg2
+
+.. code-block:: python
+
+    class ClassName(BaseClass):
+        def __init__(self, arg):
+            # constructor
+            self.value = arg
+
+'''
+
+
+def make_document(size):
+    """Return a reST document of at least `size` characters."""
+    sections = []
+    length = 0
+    number = 0
+    while length < size:
+        section = SECTION % {'number': number}
+        sections.append(section)
+        length += len(section)
+        number += 1
+    return u''.join(sections)
+
+
+WORDS = (u'the quick brown fox jumps over a lazy dog while XAML documents '
+         u'render paragraphs of text with markup in Silverlight and WPF').split()
+
+INLINE = (u'*%s*', u'**%s**', u'``%s``')
+
+CODE_LINE = u'value_%(number)d = compute(%(number)d, "text") * 2  # comment'
+
+
+def make_corpus(paragraphs=100, depth=1, list_items=5, code_blocks=0,
+                code_lines=10, inline_density=0.1, sections=10, seed=0):
+    """
+    Return a generated reST document that can be scaled along separate
+    dimensions:
+
+    * `paragraphs` - the number of top level paragraphs, spread over
+      `sections` sections
+    * `depth` - how deeply the bullet list in each section is nested
+    * `list_items` - the number of items at each level of those lists
+    * `code_blocks` and `code_lines` - the number of python code blocks,
+      spread over the sections, and the lines in each
+    * `inline_density` - the fraction of words marked up as emphasis,
+      strong or inline literal
+
+    The same arguments always give the same document.
+    """
+    from random import Random
+    random = Random(seed)
+    counter = [0]
+    
+    def sentence():
+        words = []
+        for _ in range(12):
+            word = random.choice(WORDS)
+            if random.random() < inline_density:
+                word = random.choice(INLINE) % word
+            words.append(word)
+        return u' '.join(words) + u'.'
+    
+    def paragraph(indent=u''):
+        return indent + (u'\n' + indent).join(sentence() for _ in range(3))
+    
+    def bullet_list(level, indent=u''):
+        items = []
+        for _ in range(list_items):
+            item = indent + u'* ' + sentence()
+            if level < depth:
+                item += u'\n\n' + bullet_list(level + 1, indent + u'  ')
+            items.append(item)
+        return u'\n\n'.join(items)
+    
+    def code_block():
+        lines = []
+        for _ in range(code_lines):
+            counter[0] += 1
+            lines.append(u'    ' + CODE_LINE % {'number': counter[0]})
+        return u'.. code-block:: python\n\n' + u'\n'.join(lines)
+    
+    parts = []
+    for section in range(sections):
+        title = u'Section %d' % section
+        parts.append(title + u'\n' + u'=' * len(title))
+        count = paragraphs // sections + (section < paragraphs % sections)
+        parts.extend(paragraph() for _ in range(count))
+        if depth and list_items:
+            parts.append(bullet_list(1))
+        count = code_blocks // sections + (section < code_blocks % sections)
+        parts.extend(code_block() for _ in range(count))
+    return u'\n\n'.join(parts) + u'\n'
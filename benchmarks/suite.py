@@ -0,0 +1,215 @@
+"""
+A benchmark suite over generated documents (see `benchmarks.corpus`), for
+catching performance regressions.
+
+It times `publish_xaml` in both modes for documents scaled along different
+dimensions, and `XamlFormatter` and `Node.to_string` on their own. The
+results can be saved as JSON and compared with an earlier run; any
+benchmark that has become slower than its threshold in
+``benchmarks/thresholds.json`` allows is reported as a regression and the
+suite exits with status 1.
+
+Run from the root of the repository::
+
+    python -m benchmarks.suite --save baseline.json
+    ... make changes ...
+    python -m benchmarks.suite --compare baseline.json
+"""
+
+import gc
+import os
+import platform
+import sys
+import time
+
+from optparse import OptionParser
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from docutils.core import publish_doctree
+from pygments.lexers import PythonLexer
+
+# This installs the pygments directive
+import xamlwriter.register_directive
+
+import xamlwriter
+from xamlwriter import highlight as highlight_module
+from xamlwriter.translator import XamlTranslator
+from xamlwriter.writer import publish_xaml, settings_overrides
+from xamlwriter.xamlformatter import XamlFormatter
+
+from benchmarks.corpus import CODE_LINE, make_corpus
+
+
+THRESHOLDS = os.path.join(os.path.dirname(__file__), 'thresholds.json')
+
+# the documents publish_xaml is timed with, by name
+DOCUMENTS = [
+    ('paragraphs', dict(paragraphs=400, depth=0)),
+    ('inline', dict(paragraphs=200, depth=0, inline_density=0.5)),
+    ('nested', dict(paragraphs=10, depth=6, list_items=2)),
+    ('lists', dict(paragraphs=10, depth=1, list_items=150)),
+    ('code', dict(paragraphs=10, depth=0, code_blocks=40, code_lines=20)),
+]
+
+
+class NullFile(object):
+
+    def write(self, data):
+        pass
+
+
+# short benchmarks are repeated until they have run for at least this long
+MIN_TOTAL_TIME = 1.0
+
+
+def best_time(repeat, function, *args, **keywords):
+    # as timeit does, keep the garbage collector out of the timings
+    times = []
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while len(times) < repeat or sum(times) < MIN_TOTAL_TIME:
+            start = time.time()
+            function(*args, **keywords)
+            times.append(time.time() - start)
+            gc.collect()
+    finally:
+        if enabled:
+            gc.enable()
+    return min(times)
+
+
+def run(repeat=5, only=None):
+    """
+    Run the benchmarks (those whose names start with `only`, if given) and
+    return a dictionary of benchmark name to best time in seconds.
+    """
+    results = {}
+    def bench(name, function, *args, **keywords):
+        if only is not None and not name.startswith(only):
+            return
+        results[name] = best_time(repeat, function, *args, **keywords)
+        print '%-28s %10.4fs' % (name, results[name])
+
+    # time the real highlighting, not the cache of highlighted snippets
+    cache = highlight_module.highlight_cache
+    highlight_module.highlight_cache = None
+    try:
+        for name, options in DOCUMENTS:
+            source = make_corpus(**options)
+            bench('publish_fd.' + name, publish_xaml, source)
+            bench('publish_sl.' + name, publish_xaml, source,
+                  flowdocument=False)
+    finally:
+        highlight_module.highlight_cache = cache
+
+    code = u'\n'.join(CODE_LINE % {'number': number} for number in range(2000))
+    tokens = list(PythonLexer().get_tokens(code))
+    for flowdocument, mode in ((True, 'fd'), (False, 'sl')):
+        bench('formatter_%s.2000_lines' % mode,
+              XamlFormatter(flowdocument=flowdocument).format, tokens,
+              NullFile())
+
+    document = publish_doctree(make_corpus(paragraphs=400, depth=3),
+                               settings_overrides=settings_overrides)
+    for flowdocument, mode in ((True, 'fd'), (False, 'sl')):
+        translator = XamlTranslator(document, flowdocument=flowdocument)
+        document.walkabout(translator)
+        bench('to_string_%s.paragraphs' % mode, translator.root.to_string)
+    return results
+
+
+def load_thresholds(path=THRESHOLDS):
+    """
+    Return a function that gives the largest allowed ratio of new to
+    baseline time for a benchmark name.
+    """
+    thresholds = json.load(open(path))
+    default = thresholds.pop('default')
+    def threshold(name):
+        # the most specific prefix of the name wins
+        parts = name.split('.')
+        while parts:
+            value = thresholds.get('.'.join(parts))
+            if value is not None:
+                return value
+            parts.pop()
+        return default
+    return threshold
+
+
+def compare(results, baseline, threshold):
+    """
+    Print how `results` compare with the `baseline` results and return the
+    names of the benchmarks that have regressed.
+    """
+    regressions = []
+    print
+    print '%-28s %10s %10s %8s' % ('benchmark', 'baseline', 'now', 'ratio')
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        ratio = results[name] / max(baseline[name], 1e-9)
+        note = ''
+        if ratio > threshold(name):
+            regressions.append(name)
+            note = '  REGRESSION (allowed %.2f)' % threshold(name)
+        print '%-28s %9.4fs %9.4fs %8.2f%s' % (name, baseline[name],
+                                               results[name], ratio, note)
+    return regressions
+
+
+def make_parser():
+    parser = OptionParser(usage='python -m benchmarks.suite [options]')
+    parser.add_option('-r', '--repeat', type='int', default=5,
+                      help='the best of at least REPEAT runs is used '
+                           '(default 5)')
+    parser.add_option('--only', metavar='PREFIX',
+                      help='only run the benchmarks whose names start with '
+                           'PREFIX')
+    parser.add_option('--save', metavar='FILE',
+                      help='save the results as JSON to FILE')
+    parser.add_option('--compare', metavar='FILE',
+                      help='compare the results with those saved in FILE')
+    parser.add_option('--thresholds', metavar='FILE', default=THRESHOLDS,
+                      help='the allowed slowdown for each benchmark '
+                           '(default benchmarks/thresholds.json)')
+    return parser
+
+
+def main(argv):
+    options, args = make_parser().parse_args(argv)
+    results = run(options.repeat, options.only)
+
+    if options.save:
+        data = {
+            'xamlwriter': xamlwriter.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': options.repeat,
+            'results': results,
+        }
+        handle = open(options.save, 'w')
+        try:
+            json.dump(data, handle, indent=2, sort_keys=True)
+        finally:
+            handle.close()
+
+    if options.compare:
+        baseline = json.load(open(options.compare))['results']
+        regressions = compare(results, baseline,
+                              load_thresholds(options.thresholds))
+        if regressions:
+            print
+            print 'FAILED: %d benchmarks regressed: %s' % (len(regressions),
+                ', '.join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,294 @@
+"""
+Convert many reST files to XAML, using a pool of worker processes.
+
+The workers are started once and import docutils (and pygments) once, so
+only the conversions themselves are paid for per file.
+"""
+
+import codecs
+import os
+import time
+
+from xamlwriter.cache import (DEFAULT_MAX_SIZE, DoctreeCache, RenderCache,
+                              render_key)
+from xamlwriter.highlight import highlight_code_blocks
+from xamlwriter.writer import get_doctree, publish_xaml, write_doctree
+
+__all__ = ['publish_xaml_many']
+
+
+def output_path_for(path):
+    return os.path.splitext(path)[0] + '.xaml'
+
+
+def _init_worker():
+    # This installs the pygments directive
+    import xamlwriter.register_directive
+
+
+# one cache object per class and cache directory, per process
+_caches = {}
+
+def get_cache(cache_dir, cache_size, cache_class=RenderCache):
+    key = (cache_class, cache_dir)
+    cache = _caches.get(key)
+    if cache is None:
+        cache = _caches[key] = cache_class(cache_dir, cache_size)
+    return cache
+
+
+def write_output(output_path, write):
+    """
+    Call `write` with a utf-8 file object to write the output for
+    `output_path`. The output goes to a temporary file that is renamed to
+    `output_path` once `write` returns, so a failed conversion leaves any
+    existing output alone.
+    """
+    temp_path = '%s.%d.tmp' % (output_path, os.getpid())
+    try:
+        out = codecs.open(temp_path, 'w', 'utf-8')
+        try:
+            write(out)
+        finally:
+            out.close()
+        try:
+            os.rename(temp_path, output_path)
+        except OSError:
+            # Windows won't rename over an existing file
+            if not os.path.exists(output_path):
+                raise
+            os.remove(output_path)
+            os.rename(temp_path, output_path)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def describe_error(error):
+    return '%s: %s' % (error.__class__.__name__, error)
+
+
+def _convert(task):
+    (input_path, output_path, flowdocument, overrides, xclass,
+     style_resources, cache_dir, cache_size, doctree_cache_dir) = task
+    start = time.time()
+    cache = cached = doctree_cache = error = None
+    try:
+        if cache_dir is not None:
+            cache = get_cache(cache_dir, cache_size)
+            hits = cache.hits
+        if doctree_cache_dir is not None:
+            doctree_cache = get_cache(doctree_cache_dir, cache_size,
+                                      DoctreeCache)
+        input_data = open(input_path).read().decode('utf-8')
+        write_output(output_path, lambda out: publish_xaml(
+            input_data, flowdocument=flowdocument, overrides=overrides,
+            xclass=xclass, outfile=out, streaming=True, cache=cache,
+            style_resources=style_resources, doctree_cache=doctree_cache))
+        if cache is not None:
+            cached = cache.hits > hits
+    except Exception, exc:
+        # one bad file doesn't stop the others
+        cached = None
+        error = describe_error(exc)
+    return input_path, output_path, time.time() - start, cached, error
+
+
+def publish_xaml_many(paths, jobs=None, flowdocument=True, overrides=None,
+                      xclass=True, report=None, cache_dir=None,
+                      cache_size=DEFAULT_MAX_SIZE, style_resources=False,
+                      doctree_cache_dir=None, highlight_jobs=None):
+    """
+    Convert reST files to XAML files, with `jobs` worker processes.
+
+    `paths` is a sequence of input file paths or of (input path, output path)
+    pairs. If only the input path is given the output goes next to it, with
+    a ``.xaml`` extension. The directories for the output must exist.
+
+    `jobs` defaults to the number of CPUs. With one job the files are
+    converted in this process.
+
+    If `cache_dir` is given, rendered XAML is cached there (see
+    `xamlwriter.cache.RenderCache`) and files that haven't changed are not
+    converted again.
+
+    If `doctree_cache_dir` is given, parsed doctrees are cached there (see
+    `xamlwriter.cache.DoctreeCache`), so files converted before in another
+    mode aren't parsed again. It has the same maximum size as the XAML
+    cache.
+
+    If `highlight_jobs` is given the files are parsed by the `jobs` worker
+    processes, with their code blocks deferred, then the code blocks of all
+    of them are highlighted together by `highlight_jobs` worker processes
+    (0 for one per CPU; see `xamlwriter.highlight.highlight_code_blocks`),
+    and the files are written in this process. All the parsed doctrees are
+    kept in memory until then.
+
+    `style_resources` is passed on to `publish_xaml`.
+
+    Returns a list of (input path, output path, seconds, cached, error)
+    tuples, in the order the conversions finished. `cached` is True if the
+    XAML came from the cache (and None when there's no cache). `error`
+    describes the exception that made the conversion of that file fail,
+    or is None; the other files are still converted, and the output file
+    of a failed conversion isn't touched. If `report` is given it is
+    called with each tuple as soon as that file is done.
+    """
+    tasks = []
+    for path in paths:
+        if isinstance(path, basestring):
+            path = (path, output_path_for(path))
+        input_path, output_path = path
+        tasks.append((input_path, output_path, flowdocument, overrides, xclass,
+                      style_resources, cache_dir, cache_size,
+                      doctree_cache_dir))
+    
+    if jobs is None:
+        import multiprocessing
+        jobs = multiprocessing.cpu_count()
+    
+    if highlight_jobs is not None:
+        return _publish_highlighting_batch(tasks, jobs, highlight_jobs or None,
+                                           report)
+    
+    if jobs > 1 and len(tasks) > 1:
+        return _publish_with_pool(tasks, min(jobs, len(tasks)), report)
+    
+    _init_worker()
+    done = []
+    for task in tasks:
+        result = _convert(task)
+        done.append(result)
+        if report is not None:
+            report(result)
+    return done
+
+
+def _publish_with_pool(tasks, jobs, report):
+    import multiprocessing
+    pool = multiprocessing.Pool(jobs, _init_worker)
+    try:
+        done = []
+        for result in pool.imap_unordered(_convert, tasks):
+            done.append(result)
+            if report is not None:
+                report(result)
+    except:
+        pool.terminate()
+        pool.join()
+        raise
+    pool.close()
+    pool.join()
+    return done
+
+
+def _parse(task):
+    """
+    Write the cached XAML for `task`, or parse its source with the code
+    blocks deferred. Returns (task, result, document, key, seconds), where
+    `result` is the result tuple of a file that is done (from the cache or
+    failed) and None otherwise.
+    """
+    (input_path, output_path, flowdocument, overrides, xclass,
+     style_resources, cache_dir, cache_size, doctree_cache_dir) = task
+    start = time.time()
+    key = None
+    try:
+        input_data = open(input_path).read().decode('utf-8')
+        if cache_dir is not None:
+            key = render_key(input_data, flowdocument=flowdocument,
+                             xclass=xclass, overrides=overrides,
+                             style_resources=style_resources)
+            xaml = get_cache(cache_dir, cache_size).get(key)
+            if xaml is not None:
+                write_output(output_path, lambda out: out.write(xaml))
+                return task, (input_path, output_path, time.time() - start,
+                              True, None), None, key, 0
+        doctree_cache = None
+        if doctree_cache_dir is not None:
+            doctree_cache = get_cache(doctree_cache_dir, cache_size,
+                                      DoctreeCache)
+        document = get_doctree(input_data, overrides=overrides,
+                               cache=doctree_cache)
+    except Exception, exc:
+        return task, (input_path, output_path, time.time() - start, None,
+                      describe_error(exc)), None, key, 0
+    # these belong to the conversion, and are set up again when it's written
+    document.settings = document.reporter = document.transformer = None
+    return task, None, document, key, time.time() - start
+
+
+def _publish_highlighting_batch(tasks, jobs, highlight_jobs, report):
+    done = []
+    def finish(result):
+        done.append(result)
+        if report is not None:
+            report(result)
+    
+    # write what is in the cache and parse the rest, with the code blocks
+    # deferred, in `jobs` processes
+    parsed = []
+    if jobs > 1 and len(tasks) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(jobs, len(tasks)), _init_worker)
+        try:
+            entries = list(pool.imap_unordered(_parse, tasks))
+        except:
+            pool.terminate()
+            pool.join()
+            raise
+        pool.close()
+        pool.join()
+    else:
+        _init_worker()
+        entries = map(_parse, tasks)
+    for entry in entries:
+        if entry[1] is not None:
+            finish(entry[1])
+        else:
+            parsed.append(entry)
+    
+    # highlight the code blocks of all the documents together; they all
+    # have the same mode
+    if parsed:
+        task = parsed[0][0]
+        try:
+            highlight_code_blocks([entry[2] for entry in parsed],
+                                  flowdocument=task[2],
+                                  style_resources=task[5],
+                                  jobs=highlight_jobs)
+        except Exception:
+            # find the files that fail, one at a time in this process
+            highlighted = []
+            for entry in parsed:
+                task, seconds = entry[0], entry[4]
+                start = time.time()
+                try:
+                    highlight_code_blocks([entry[2]], flowdocument=task[2],
+                                          style_resources=task[5], jobs=1)
+                except Exception, exc:
+                    finish((task[0], task[1], seconds + time.time() - start,
+                            None, describe_error(exc)))
+                else:
+                    highlighted.append(entry)
+            parsed = highlighted
+    
+    for task, _, document, key, seconds in parsed:
+        (input_path, output_path, flowdocument, overrides, xclass,
+         style_resources, cache_dir, cache_size) = task[:8]
+        start = time.time()
+        cached = error = None
+        try:
+            xaml = write_doctree(document, flowdocument=flowdocument,
+                                 overrides=overrides, xclass=xclass,
+                                 style_resources=style_resources)
+            write_output(output_path, lambda out: out.write(xaml))
+            if cache_dir is not None:
+                get_cache(cache_dir, cache_size).set(key, xaml)
+                cached = False
+        except Exception, exc:
+            error = describe_error(exc)
+        finish((input_path, output_path, seconds + time.time() - start,
+                cached, error))
+    return done
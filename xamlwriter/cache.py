@@ -0,0 +1,328 @@
+"""
+Caches for rendered XAML.
+
+`RenderCache` is a content-addressed, size-bounded cache on disk. Entries
+are keyed by a hash of everything that affects the output (see
+`render_key`) and stored one file per entry. When the cache grows beyond
+its maximum size the least recently used entries are removed.
+
+`DoctreeCache` keeps parsed docutils doctrees the same way (see
+`doctree_key`), so a document can be written in several modes, or again,
+without being parsed again.
+
+`LRUCache` is a small in-memory cache with the same eviction policy.
+"""
+
+import cPickle as pickle
+import os
+import tempfile
+import threading
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+import docutils
+import pygments
+
+import xamlwriter
+
+__all__ = ['CACHE_FORMAT', 'DoctreeCache', 'LRUCache', 'RenderCache',
+           'doctree_key', 'render_key']
+
+
+DEFAULT_MAX_SIZE = 100 * 1024 * 1024
+
+EXTENSION = '.xaml'
+
+
+def _source_digest():
+    """
+    Return a digest of the source of the xamlwriter package (without the
+    tests), or its version if the source isn't there.
+    """
+    package = os.path.dirname(os.path.abspath(xamlwriter.__file__))
+    digest = sha1()
+    found = False
+    for dirpath, dirnames, filenames in os.walk(package):
+        dirnames[:] = sorted(name for name in dirnames if name != 'tests')
+        for filename in sorted(filenames):
+            if not filename.endswith('.py'):
+                continue
+            path = os.path.join(dirpath, filename)
+            handle = open(path, 'rb')
+            try:
+                data = handle.read()
+            finally:
+                handle.close()
+            digest.update(os.path.relpath(path, package).replace(os.sep, '/'))
+            digest.update(data)
+            found = True
+    if not found:
+        return xamlwriter.__version__
+    return digest.hexdigest()
+
+# Part of the key of every persistent cache (rendered XAML, highlighted code
+# blocks and pickled doctrees), so that entries written by other versions of
+# the code are never used. `__version__` isn't changed often enough for that.
+CACHE_FORMAT = _source_digest()
+
+
+def render_key(input_data, flowdocument=True, xclass=True, overrides=None,
+               store_code_blocks=None, style_resources=False):
+    """
+    Return the cache key for converting `input_data` with the given
+    `publish_xaml` arguments.
+
+    The key also covers the code of rst2xaml (see `CACHE_FORMAT`) and the
+    versions of docutils and pygments.
+    """
+    if store_code_blocks is None:
+        from xamlwriter import register_directive
+        store_code_blocks = register_directive.store_code_blocks
+    if isinstance(input_data, unicode):
+        input_data = input_data.encode('utf-8')
+    options = (
+        bool(flowdocument), bool(xclass), sorted((overrides or {}).items()),
+        bool(store_code_blocks), bool(style_resources),
+        CACHE_FORMAT, docutils.__version__, pygments.__version__,
+    )
+    digest = sha1(repr(options))
+    digest.update(input_data)
+    return digest.hexdigest()
+
+
+def doctree_key(input_data, overrides=None, store_code_blocks=None):
+    """
+    Return the cache key for the doctree of `input_data`, parsed with code
+    blocks deferred (see `xamlwriter.writer.get_doctree`). The output mode
+    doesn't affect the doctree, so it isn't part of the key.
+    """
+    if store_code_blocks is None:
+        from xamlwriter import register_directive
+        store_code_blocks = register_directive.store_code_blocks
+    if isinstance(input_data, unicode):
+        input_data = input_data.encode('utf-8')
+    options = (
+        'doctree', sorted((overrides or {}).items()), bool(store_code_blocks),
+        CACHE_FORMAT, docutils.__version__,
+    )
+    digest = sha1(repr(options))
+    digest.update(input_data)
+    return digest.hexdigest()
+
+
+class RenderCache(object):
+    """
+    Cache rendered XAML in `directory`, which is created if it doesn't
+    exist, keeping the total size of the entries under `max_size` bytes.
+
+    `hits` and `misses` count the lookups made through this object.
+    """
+
+    extension = EXTENSION
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # total size of the entries, found the first time it is needed
+        self.size = None
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by another process in the meantime
+                if not os.path.isdir(directory):
+                    raise
+
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key + self.extension)
+
+
+    def get(self, key):
+        """Return the XAML cached under `key`, or None."""
+        data = self.read(key)
+        if data is None:
+            return None
+        return data.decode('utf-8')
+
+
+    def set(self, key, xaml):
+        """Store `xaml` under `key`, evicting old entries if needed."""
+        if isinstance(xaml, unicode):
+            xaml = xaml.encode('utf-8')
+        self.write(key, xaml)
+
+
+    def read(self, key):
+        """Return the bytes stored under `key`, or None."""
+        path = self.path_for(key)
+        try:
+            handle = open(path, 'rb')
+        except IOError:
+            self.misses += 1
+            return None
+        try:
+            data = handle.read()
+        finally:
+            handle.close()
+        self.hits += 1
+        try:
+            # mark the entry as recently used
+            os.utime(path, None)
+        except OSError:
+            pass
+        return data
+
+
+    def write(self, key, data):
+        """Store the bytes `data` under `key`."""
+        handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            os.write(handle, data)
+        finally:
+            os.close(handle)
+        # renaming makes the entry appear atomically to other processes
+        path = self.path_for(key)
+        try:
+            # the size of an entry this one replaces
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        try:
+            os.rename(temp_path, path)
+        except OSError:
+            # Windows won't rename over an existing file
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            os.rename(temp_path, path)
+        
+        if self.size is None:
+            self.size = self.total_size()
+        else:
+            self.size += len(data) - replaced
+        if self.size > self.max_size:
+            self.evict()
+
+
+    def entries(self):
+        """Return (last used, size, path) for every entry."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.extension):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+
+    def total_size(self):
+        return sum(size for _, size, _ in self.entries())
+
+
+    def evict(self):
+        """Remove the least recently used entries until under `max_size`."""
+        entries = self.entries()
+        entries.sort()
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # removed by another process
+                pass
+            size -= entry_size
+        self.size = size
+
+
+class DoctreeCache(RenderCache):
+    """
+    Cache pickled docutils doctrees in `directory`, like `RenderCache`.
+
+    The settings, reporter and transformer of a document aren't stored;
+    they belong to a conversion and are set up again when the doctree is
+    written (see `xamlwriter.writer.write_doctree`).
+    """
+
+    extension = '.doctree'
+
+    def get(self, key):
+        """Return the doctree cached under `key`, or None."""
+        data = self.read(key)
+        if data is None:
+            return None
+        return pickle.loads(data)
+
+
+    def set(self, key, document):
+        saved = document.settings, document.reporter, document.transformer
+        document.settings = document.reporter = document.transformer = None
+        try:
+            data = pickle.dumps(document, pickle.HIGHEST_PROTOCOL)
+        finally:
+            document.settings, document.reporter, document.transformer = saved
+        self.write(key, data)
+
+
+class LRUCache(object):
+    """
+    An in-memory cache holding at most `max_entries` values.
+
+    When it is full the least recently used quarter of the entries is
+    removed in one go, so that the cost of eviction is spread out.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        # key -> (last used, value)
+        self.entries = {}
+        self.clock = 0
+        self.lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def get(self, key):
+        """Return the value stored under `key`, or None."""
+        self.lock.acquire()
+        try:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.clock += 1
+            self.entries[key] = (self.clock, entry[1])
+            return entry[1]
+        finally:
+            self.lock.release()
+
+
+    def set(self, key, value):
+        self.lock.acquire()
+        try:
+            self.clock += 1
+            self.entries[key] = (self.clock, value)
+            if len(self.entries) > self.max_entries:
+                self.evict()
+        finally:
+            self.lock.release()
+
+
+    def evict(self):
+        entries = sorted(self.entries.iteritems(), key=lambda item: item[1][0])
+        keep = self.max_entries * 3 // 4
+        for key, _ in entries[:len(entries) - keep]:
+            del self.entries[key]
@@ -0,0 +1,225 @@
+"""
+Command line handling shared by the ``rst2xaml`` and ``rst2xamlsl`` scripts.
+"""
+
+import codecs
+import os
+import time
+
+from optparse import OptionParser
+
+from xamlwriter.batch import publish_xaml_many
+from xamlwriter.cache import DoctreeCache, RenderCache
+from xamlwriter.incremental import IncrementalPublisher
+from xamlwriter.nodestats import NodeStats
+from xamlwriter.writer import publish_xaml, publish_xaml_timed
+
+
+USAGE = """\
+%(name)s [options] input_file output_file
+       %(name)s [options] input_directory output_directory"""
+
+# files converted in directory mode
+SOURCE_EXTENSIONS = ('.txt', '.rst')
+
+# seconds between checks for changes with --watch
+WATCH_INTERVAL = 0.5
+
+
+def find_sources(input_dir, output_dir):
+    """
+    Return (input path, output path) pairs for the reST files under
+    `input_dir`, mirroring the directory structure into `output_dir`.
+    """
+    pairs = []
+    for dirpath, dirnames, filenames in os.walk(input_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            base, extension = os.path.splitext(filename)
+            if extension.lower() not in SOURCE_EXTENSIONS:
+                continue
+            relative = os.path.relpath(os.path.join(dirpath, base), input_dir)
+            pairs.append((os.path.join(dirpath, filename),
+                          os.path.join(output_dir, relative + '.xaml')))
+    return pairs
+
+
+def make_parser(name):
+    parser = OptionParser(usage=USAGE % {'name': name})
+    parser.add_option('-j', '--jobs', type='int', default=1,
+                      help='number of worker processes for directory mode '
+                           '(default 1, 0 for one per CPU)')
+    parser.add_option('--highlight-jobs', type='int', metavar='N',
+                      help='highlight the code blocks after parsing, all '
+                           'together, in N worker processes (0 for one per '
+                           'CPU); in directory mode the files are parsed '
+                           'by the -j workers first and written in one '
+                           'process')
+    parser.add_option('--cache-dir', metavar='DIRECTORY',
+                      help='cache rendered XAML in DIRECTORY and reuse it '
+                           'for documents that have not changed')
+    parser.add_option('--cache-size', type='int', default=100, metavar='MB',
+                      help='maximum size of each cache (default 100 MB)')
+    parser.add_option('--doctree-cache-dir', metavar='DIRECTORY',
+                      help='cache parsed documents in DIRECTORY, so that '
+                           'converting them again, in either mode, only '
+                           'writes the XAML')
+    parser.add_option('--style-resources', action='store_true', default=False,
+                      help='define the text styles (Silverlight) or code '
+                           'token styles (FlowDocument) once as resources '
+                           'instead of on every element')
+    parser.add_option('--timings', action='store_true', default=False,
+                      help='print the time taken by each phase of the '
+                           'conversion and by the slowest code blocks '
+                           '(single files only, the cache is not used)')
+    parser.add_option('--watch', action='store_true', default=False,
+                      help='keep running and convert the input file again '
+                           'whenever it changes, only translating the '
+                           'top-level sections that changed (single files '
+                           'only)')
+    parser.add_option('--node-stats', action='store_true', default=False,
+                      help='with --timings, also print counts and timings '
+                           'for each docutils node type and XAML element')
+    return parser
+
+
+def print_cache_stats(hits, misses, name='Cache'):
+    print '%s: %d hits, %d misses' % (name, hits, misses)
+
+
+def convert_file(input_path, output_path, flowdocument, options):
+    if options.timings:
+        return time_file(input_path, output_path, flowdocument, options)
+    cache = doctree_cache = None
+    if options.cache_dir is not None:
+        cache = RenderCache(options.cache_dir, options.cache_size * 1024 * 1024)
+    if options.doctree_cache_dir is not None:
+        doctree_cache = DoctreeCache(options.doctree_cache_dir,
+                                     options.cache_size * 1024 * 1024)
+    input_data = open(input_path).read().decode('utf-8')
+    handle = codecs.open(output_path, 'w', 'utf-8')
+    try:
+        publish_xaml(input_data, flowdocument=flowdocument, outfile=handle,
+                     streaming=True, cache=cache,
+                     style_resources=options.style_resources,
+                     doctree_cache=doctree_cache,
+                     highlight_jobs=options.highlight_jobs)
+    finally:
+        handle.close()
+    if cache is not None:
+        print_cache_stats(cache.hits, cache.misses)
+    if doctree_cache is not None:
+        print_cache_stats(doctree_cache.hits, doctree_cache.misses,
+                          'Doctree cache')
+
+
+def time_file(input_path, output_path, flowdocument, options):
+    node_stats = None
+    if options.node_stats:
+        node_stats = NodeStats()
+    input_data = open(input_path).read().decode('utf-8')
+    handle = codecs.open(output_path, 'w', 'utf-8')
+    try:
+        _, timings = publish_xaml_timed(input_data, flowdocument=flowdocument,
+                                        outfile=handle, streaming=True,
+                                        style_resources=options.style_resources,
+                                        node_stats=node_stats)
+    finally:
+        handle.close()
+    print 'Timings for %s:' % input_path
+    for line in timings.report():
+        print '  ' + line
+    if node_stats is not None:
+        print 'Translation by node type:'
+        for line in node_stats.report():
+            print '  ' + line
+
+
+def watch_file(input_path, output_path, flowdocument, options,
+               interval=WATCH_INTERVAL):
+    """
+    Convert `input_path` whenever its modification time changes, with an
+    `IncrementalPublisher`, until interrupted.
+    """
+    publisher = IncrementalPublisher(flowdocument=flowdocument,
+                                     style_resources=options.style_resources)
+    mtime = None
+    while True:
+        current = os.stat(input_path).st_mtime
+        if current != mtime:
+            mtime = current
+            start = time.time()
+            input_data = open(input_path).read().decode('utf-8')
+            handle = codecs.open(output_path, 'w', 'utf-8')
+            try:
+                publisher.publish(input_data, outfile=handle)
+            finally:
+                handle.close()
+            print '%8.3fs  %s (%d of %d parts translated)' % (
+                time.time() - start, input_path, publisher.translated,
+                publisher.translated + publisher.reused)
+        time.sleep(interval)
+
+
+def convert_directory(input_dir, output_dir, flowdocument, options):
+    pairs = find_sources(input_dir, output_dir)
+    for output_path in set(os.path.dirname(output) for _, output in pairs):
+        if not os.path.isdir(output_path):
+            os.makedirs(output_path)
+    
+    def report(result):
+        input_path, output_path, seconds, cached, error = result
+        note = ''
+        if error is not None:
+            note = ' (failed)'
+        elif cached:
+            note = ' (cached)'
+        print '%8.3fs  %s%s' % (seconds, input_path, note)
+    
+    start = time.time()
+    results = publish_xaml_many(pairs, jobs=options.jobs or None,
+                                flowdocument=flowdocument, report=report,
+                                cache_dir=options.cache_dir,
+                                cache_size=options.cache_size * 1024 * 1024,
+                                style_resources=options.style_resources,
+                                doctree_cache_dir=options.doctree_cache_dir,
+                                highlight_jobs=options.highlight_jobs)
+    failed = [result for result in results if result[4] is not None]
+    print 'Converted %d files in %.3fs' % (len(results) - len(failed),
+                                           time.time() - start)
+    if options.cache_dir is not None:
+        hits = len([result for result in results if result[3]])
+        print_cache_stats(hits, len(results) - len(failed) - hits)
+    if failed:
+        print 'Failed to convert %d files:' % len(failed)
+        for input_path, _, _, _, error in sorted(failed):
+            print '  %s: %s' % (input_path, error)
+    return len(failed)
+
+
+def main(argv, name='rst2xaml', flowdocument=True):
+    """Run the script called `name` with the arguments `argv`."""
+    parser = make_parser(name)
+    options, args = parser.parse_args(argv)
+    if len(args) != 2:
+        parser.print_usage()
+        return 1
+    
+    source, destination = args
+    if os.path.isdir(source):
+        if options.timings:
+            print '--timings only works for a single input file'
+            return 1
+        if options.watch:
+            print '--watch only works for a single input file'
+            return 1
+        if convert_directory(source, destination, flowdocument, options):
+            return 1
+    elif options.watch:
+        try:
+            watch_file(source, destination, flowdocument, options)
+        except KeyboardInterrupt:
+            pass
+    else:
+        convert_file(source, destination, flowdocument, options)
+    return 0
@@ -0,0 +1,82 @@
+"""
+Event handlers for `XamlEventTranslator`, which reports the XAML it
+generates as start element, text and end element events instead of building
+a node tree.
+
+A handler is any object with these three methods::
+
+    start_element(name, attributes)
+    text(data)
+    end_element(name)
+
+where `attributes` is a sequence of (name, value) pairs and `data` is
+already escaped XAML.
+"""
+
+__all__ = ['EventBuffer', 'XamlEmitter']
+
+
+class XamlEmitter(object):
+    """
+    An event handler that writes XAML to the file-like object `out`.
+
+    A start tag is left open until the element's first child (or its end)
+    arrives, so that empty elements are written as ``<Name />`` exactly as
+    `Node.to_string` writes them.
+    """
+
+    def __init__(self, out):
+        self.write = out.write
+        self.pending = False
+
+
+    def start_element(self, name, attributes):
+        if self.pending:
+            self.write('>')
+        attribute_string = "".join(' %s="%s"' % (key, value) for key, value in 
+                                    attributes)
+        self.write('<%s' % (name + attribute_string))
+        self.pending = True
+
+
+    def text(self, data):
+        if self.pending:
+            self.write('>')
+            self.pending = False
+        self.write(data)
+
+
+    def end_element(self, name):
+        if self.pending:
+            self.write(' />')
+            self.pending = False
+        else:
+            self.write('</%s>' % name)
+
+
+class EventBuffer(object):
+    """
+    An event handler that records events so that they can be replayed into
+    another handler later.
+    """
+
+    def __init__(self):
+        self.events = []
+
+
+    def start_element(self, name, attributes):
+        self.events.append(('start_element', (name, attributes)))
+
+
+    def text(self, data):
+        self.events.append(('text', (data,)))
+
+
+    def end_element(self, name):
+        self.events.append(('end_element', (name,)))
+
+
+    def replay(self, handler):
+        for method, args in self.events:
+            getattr(handler, method)(*args)
+        self.events = []
@@ -0,0 +1,262 @@
+"""
+Syntax highlighting of code blocks as XAML, with the pygments lexers and
+XAML formatters cached between code blocks.
+
+The highlighted XAML itself is cached too, in `highlight_cache`, so a
+snippet that appears many times is only highlighted once. Set
+`highlight_cache` to a `HighlightCache` with a directory to keep the
+results between runs, or to None to switch the cache off.
+
+`code_block` is the doctree node for a code block whose highlighting is
+deferred until the doctree is written. `highlight_code_blocks` highlights
+the deferred code blocks of one or more doctrees in a pool of processes.
+"""
+
+import threading
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+from docutils import nodes
+
+import pygments
+from pygments import highlight
+from pygments.lexers import get_lexer_by_name, TextLexer
+
+from xamlwriter.cache import (CACHE_FORMAT, DEFAULT_MAX_SIZE, LRUCache,
+                              RenderCache)
+from xamlwriter.walker import iter_nodes
+from xamlwriter.xamlformatter import XamlFormatter
+
+__all__ = ['HighlightCache', 'code_block', 'get_formatter', 'get_lexer',
+           'highlight_code', 'highlight_code_blocks']
+
+
+# the lexer cache is emptied when it grows beyond this (documents can use
+# any language name, including ones that don't exist)
+MAX_LEXERS = 100
+
+_lexers = {}
+_formatters = {}
+
+
+def get_lexer(language, **options):
+    """
+    Return a lexer for `language`, falling back to the text lexer if there
+    isn't one. Lexers are cached by language name and options.
+    """
+    key = (language, tuple(sorted(options.items())))
+    lexer = _lexers.get(key)
+    if lexer is None:
+        try:
+            lexer = get_lexer_by_name(language, **options)
+        except ValueError:
+            # no lexer found - use the text one instead of an exception
+            lexer = TextLexer(**options)
+        if len(_lexers) >= MAX_LEXERS:
+            _lexers.clear()
+        _lexers[key] = lexer
+    return lexer
+
+
+def get_formatter(flowdocument=True, store_code_blocks=False,
+                  style_resources=False):
+    """Return a (shared) `XamlFormatter` for the given mode."""
+    key = (bool(flowdocument), bool(store_code_blocks),
+           bool(style_resources and flowdocument))
+    formatter = _formatters.get(key)
+    if formatter is None:
+        formatter = _formatters[key] = XamlFormatter(
+            flowdocument=flowdocument, store_code_blocks=store_code_blocks,
+            style_resources=style_resources)
+    return formatter
+
+
+class HighlightCache(object):
+    """
+    A cache of highlighted XAML, keyed by language, a hash of the code and
+    the formatter mode.
+
+    Up to `max_entries` results are kept in memory. If `directory` is given
+    the results are also stored on disk there, in a `RenderCache` of at most
+    `max_size` bytes, and can be used by later runs.
+
+    `hits` and `misses` count the lookups (a hit from either tier counts as
+    a hit). The cache can be shared between threads.
+    """
+
+    def __init__(self, max_entries=1000, directory=None,
+                 max_size=DEFAULT_MAX_SIZE):
+        self.memory = LRUCache(max_entries)
+        self.disk = None
+        if directory is not None:
+            self.disk = RenderCache(directory, max_size)
+        self.hits = 0
+        self.misses = 0
+        # for the counters and the disk tier, which has no locking of its
+        # own (the memory tier does)
+        self.lock = threading.Lock()
+
+
+    def key(self, language, code, flowdocument, store_code_blocks,
+            style_resources=False):
+        if isinstance(code, unicode):
+            code = code.encode('utf-8')
+        options = (language, bool(flowdocument), bool(store_code_blocks),
+                   CACHE_FORMAT, pygments.__version__)
+        if style_resources and flowdocument:
+            options += ('style_resources',)
+        digest = sha1(repr(options))
+        digest.update(code)
+        return digest.hexdigest()
+
+
+    def get(self, key):
+        """Return the XAML cached under `key`, or None."""
+        xaml = self.memory.get(key)
+        self.lock.acquire()
+        try:
+            if xaml is None and self.disk is not None:
+                xaml = self.disk.get(key)
+                if xaml is not None:
+                    self.memory.set(key, xaml)
+            if xaml is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        finally:
+            self.lock.release()
+        return xaml
+
+
+    def set(self, key, xaml):
+        self.memory.set(key, xaml)
+        if self.disk is not None:
+            self.lock.acquire()
+            try:
+                self.disk.set(key, xaml)
+            finally:
+                self.lock.release()
+
+
+highlight_cache = HighlightCache()
+
+
+def _highlight(language, code, formatter, tokens):
+    if tokens is None:
+        return highlight(code, get_lexer(language), formatter)
+    # the token lists are shared by the calls that format the same code in
+    # different modes
+    key = (language, code)
+    code_tokens = tokens.get(key)
+    if code_tokens is None:
+        code_tokens = tokens[key] = list(pygments.lex(code,
+                                                      get_lexer(language)))
+    return pygments.format(code_tokens, formatter)
+
+
+def highlight_code(language, code, flowdocument=True, store_code_blocks=False,
+                   style_resources=False, tokens=None):
+    """
+    Return the highlighted XAML for the source `code` in `language`, from
+    `highlight_cache` if it's there.
+
+    `tokens` is an optional dictionary in which the lexed tokens are kept
+    by language and code, so highlighting the same code again in another
+    mode doesn't lex it again.
+    """
+    formatter = get_formatter(flowdocument, store_code_blocks, style_resources)
+    cache = highlight_cache
+    if cache is None:
+        return _highlight(language, code, formatter, tokens)
+    
+    key = cache.key(language, code, flowdocument, store_code_blocks,
+                    style_resources)
+    xaml = cache.get(key)
+    if xaml is None:
+        xaml = _highlight(language, code, formatter, tokens)
+        cache.set(key, xaml)
+    return xaml
+
+
+class code_block(nodes.General, nodes.FixedTextElement):
+    """
+    A code block that hasn't been highlighted yet, with the attributes
+    'language' and 'store_code_blocks'. The pygments directive creates these
+    instead of raw XAML when the 'xaml_defer_code_blocks' setting is on, so
+    the doctree doesn't depend on the output mode; the translator
+    highlights them.
+    """
+
+
+def _highlight_task(task):
+    # the results are added to the cache by the parent process
+    language, code, flowdocument, store_code_blocks, style_resources = task
+    formatter = get_formatter(flowdocument, store_code_blocks, style_resources)
+    return _highlight(language, code, formatter, None)
+
+
+def highlight_code_blocks(documents, flowdocument=True, style_resources=False,
+                          jobs=None, pool=None):
+    """
+    Highlight the deferred `code_block` nodes of `documents` (doctrees from
+    `xamlwriter.writer.get_doctree`) for one output mode, with `jobs` worker
+    processes, and replace each of them with the raw XAML node the pygments
+    directive would have created.
+
+    Snippets that appear more than once, or that are in `highlight_cache`,
+    are only highlighted once, in this process's cache. `jobs` defaults to
+    the number of CPUs; with one job (or one snippet) no processes are
+    started. An existing `multiprocessing.Pool` can be passed as `pool`
+    instead, to save starting the processes for every call; it is left
+    running. Returns the number of snippets that were highlighted.
+    """
+    blocks = []
+    for document in documents:
+        blocks.extend(iter_nodes(document, code_block))
+    cache = highlight_cache
+    results = {}
+    tasks = []
+    for node in blocks:
+        task = (node['language'], node.astext(), flowdocument,
+                node['store_code_blocks'], style_resources)
+        if task in results:
+            continue
+        results[task] = None
+        if cache is not None:
+            results[task] = cache.get(cache.key(*task))
+        if results[task] is None:
+            tasks.append(task)
+    
+    if jobs is None:
+        import multiprocessing
+        jobs = multiprocessing.cpu_count()
+    if pool is not None and len(tasks) > 1:
+        chunksize = max(1, len(tasks) // (jobs * 4))
+        highlighted = pool.map(_highlight_task, tasks, chunksize)
+    elif jobs > 1 and len(tasks) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(jobs, len(tasks)))
+        try:
+            chunksize = max(1, len(tasks) // (jobs * 4))
+            highlighted = pool.map(_highlight_task, tasks, chunksize)
+        except:
+            pool.terminate()
+            pool.join()
+            raise
+        pool.close()
+        pool.join()
+    else:
+        highlighted = [_highlight_task(task) for task in tasks]
+    
+    for task, xaml in zip(tasks, highlighted):
+        results[task] = xaml
+        if cache is not None:
+            cache.set(cache.key(*task), xaml)
+    for node in blocks:
+        task = (node['language'], node.astext(), flowdocument,
+                node['store_code_blocks'], style_resources)
+        node.replace_self(nodes.raw('', results[task], format='xaml'))
+    return len(tasks)
@@ -0,0 +1,176 @@
+"""
+Rebuilding the XAML for a large document after an edit, translating only
+the top-level sections that changed since the last build.
+
+The document is still parsed as a whole (references, footnotes and the
+title styles can cross sections), but the doctree is split into its
+top-level sections, and the runs of other nodes between them, and each of
+these parts gets a fingerprint of its subtree. The XAML of a part whose
+fingerprint is the same as in the previous build is reused, the others are
+translated, and the parts are spliced together into the FlowDocument or
+StackPanel root.
+
+The translator state at the boundary between top-level parts is always the
+same, so the XAML of a part depends only on its own subtree and the options
+of the conversion.
+"""
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+from docutils import nodes
+
+from xamlwriter.translator import XamlTranslator
+from xamlwriter.walker import iter_nodes, walkabout
+from xamlwriter.writer import XamlPublisher
+
+__all__ = ['IncrementalPublisher', 'fingerprint', 'split_parts']
+
+# Attributes left out of the fingerprints. The translator doesn't write the
+# internal links, and their generated ids change with edits to any earlier
+# part of the document.
+IGNORED_ATTRIBUTES = frozenset(['ids', 'names', 'dupnames', 'backrefs',
+                                'refid'])
+
+
+def split_parts(document):
+    """
+    Split the children of `document` into a list of parts: each top-level
+    section is a part on its own, and the nodes between sections are
+    grouped into one part. Each part is a list of nodes.
+    """
+    parts = []
+    run = []
+    for child in document.children:
+        if isinstance(child, nodes.section):
+            if run:
+                parts.append(run)
+                run = []
+            parts.append([child])
+        else:
+            run.append(child)
+    if run:
+        parts.append(run)
+    return parts
+
+
+def fingerprint(part):
+    """
+    Return a digest of the node classes, attributes and text of the nodes
+    in `part` (a list of nodes) and all of their descendants.
+    """
+    ignored = IGNORED_ATTRIBUTES
+    digest = sha1()
+    update = digest.update
+    for top in part:
+        for node in iter_nodes(top):
+            if isinstance(node, nodes.Text):
+                text = node.encode('utf-8')
+                update('T%d:' % len(text))
+                update(text)
+                continue
+            # most nodes only have the empty lists docutils gives them
+            attributes = [item for item in node.attributes.iteritems()
+                          if item[1] and item[0] not in ignored]
+            if attributes:
+                attributes.sort()
+                attributes = repr(attributes)
+            else:
+                attributes = ''
+            update('E%s:%d:%d:' % (node.__class__.__name__, len(node.children),
+                                   len(attributes)))
+            update(attributes)
+    return digest.hexdigest()
+
+
+class IncrementalPublisher(object):
+    """
+    Converts successive versions of a document, reusing the XAML of the
+    top-level sections that didn't change since the previous call to
+    `publish`. The arguments are those of `XamlPublisher` (without
+    `streaming`).
+
+    The code blocks are highlighted when the part they are in is
+    translated, rather than while parsing, so the code blocks of unchanged
+    sections aren't highlighted again.
+
+    Only the XAML for the parts of the last build is kept, so the memory
+    used doesn't grow with the number of builds. After each build
+    `translated` and `reused` are the number of parts translated and
+    reused.
+    """
+
+    def __init__(self, flowdocument=True, overrides=None, xclass=True,
+                 store_code_blocks=None, style_resources=False):
+        self.flowdocument = flowdocument
+        self.xclass = xclass
+        self.style_resources = style_resources
+        # the code blocks are highlighted when their part is translated
+        overrides = dict(overrides or {})
+        overrides['xaml_defer_code_blocks'] = True
+        self.publisher = XamlPublisher(flowdocument=flowdocument,
+                                       overrides=overrides, xclass=xclass,
+                                       store_code_blocks=store_code_blocks,
+                                       style_resources=style_resources)
+        self.fragments = {}
+        self.translated = self.reused = 0
+
+
+    def make_translator(self, document):
+        return XamlTranslator(document, flowdocument=self.flowdocument,
+                              xclass=self.xclass,
+                              style_resources=self.style_resources)
+
+
+    def translate_part(self, document, part):
+        """Return the XAML for the nodes of `part` as a string."""
+        translator = self.make_translator(document)
+        for node in part:
+            walkabout(node, translator)
+        return ''.join(child.to_string() for child in translator.root.children)
+
+
+    def publish(self, input_data, outfile=None):
+        """
+        Convert the reST source `input_data` to XAML, returned as a string
+        unless it is written to `outfile`. The result is the same as from
+        `publish_xaml` with the same options.
+        """
+        document = self.publisher.read(input_data)
+        # the root element, and the style resources that visit_document adds
+        translator = self.make_translator(document)
+        translator.dispatch_visit(document)
+        root = translator.root
+        chunks = [child.to_string() for child in root.children]
+
+        fragments = {}
+        translated = reused = 0
+        for part in split_parts(document):
+            key = fingerprint(part)
+            xaml = fragments.get(key)
+            if xaml is None:
+                xaml = self.fragments.get(key)
+            if xaml is None:
+                xaml = self.translate_part(document, part)
+                translated += 1
+            else:
+                reused += 1
+            fragments[key] = xaml
+            chunks.append(xaml)
+        self.fragments = fragments
+        self.translated, self.reused = translated, reused
+
+        attribute_string = ''.join(' %s="%s"' % (key, value) for key, value in
+                                   root.attribute_items())
+        body = ''.join(chunks)
+        if body:
+            xaml = '<%s%s>%s</%s>' % (root.name, attribute_string, body,
+                                      root.name)
+        else:
+            xaml = '<%s%s />' % (root.name, attribute_string)
+        if outfile is not None:
+            outfile.write(xaml)
+            return None
+        return xaml
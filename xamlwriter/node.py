@@ -1,4 +1,3 @@
-
 # requires either Python 2.6 or the odict module
 try:
     from odict import OrderedDict
@@ -9,19 +8,21 @@ except ImportError:
 not_implemented = lambda *_: NotImplemented
 
 
-class Node(object):
-    def __init__(self, name):
-        self.name = name
-        self.attributes = OrderedDict()
-        self.children = []
-        self.parent = None
+class BaseNode(object):
+    """
+    Behaviour shared by the element node classes, `Node` and `CompactNode`.
 
+    Subclasses provide `name`, `children`, `parent` and an `attribute_items`
+    method. Elements of either class compare equal if they have the same
+    name, attributes and children.
+    """
+    __slots__ = ()
 
     def __eq__(self, other):
-        return (type(other) == type(self) and
+        return (isinstance(other, BaseNode) and
                 self.name == other.name and
-                dict(self.attributes) == dict(other.attributes) and
-                self.children == other.children)
+                dict(self.attribute_items()) == dict(other.attribute_items()) and
+                list(self.children) == list(other.children))
 
 
     def __ne__(self, other):
@@ -32,20 +33,116 @@ class Node(object):
     __hash__ = None
 
 
+    def iter_chunks(self):
+        """
+        Yield the XAML for this node and all of its children as a series of
+        string chunks.
+
+        The tree is walked with an explicit stack rather than by recursion, so
+        no subtree is ever built up as an intermediate string.
+        """
+        stack = [self]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            node = pop()
+            if isinstance(node, basestring):
+                # a closing tag pushed by its element
+                yield node
+                continue
+            if isinstance(node, TextNode):
+                yield node.data
+                continue
+            attribute_string = "".join(' %s="%s"' % (key, value) for key, value in 
+                                        node.attribute_items())
+            if not node.children:
+                yield '<%s />' % (node.name + attribute_string)
+                continue
+            yield '<%s>' % (node.name + attribute_string)
+            push('</%s>' % node.name)
+            stack.extend(reversed(node.children))
+
+
+    def write(self, out):
+        """Write the XAML for this node to the file-like object `out`."""
+        write = out.write
+        for chunk in self.iter_chunks():
+            write(chunk)
+
+
     def to_string(self):
-        attribute_string = "".join(' %s="%s"' % (key, value) for key, value in 
-                                    self.attributes.items())
-        name = self.name
-        if not self.children:
-            return '<%s />' % (name + attribute_string)
-        children_string = "".join(node.to_string() for node in self.children)
-        return '<%s>%s</%s>' % (name + attribute_string, children_string, self.name)
+        return "".join(self.iter_chunks())
 
     # Hmmm...
-    __repr__ = to_string
+    def __repr__(self):
+        return self.to_string()
+
+
+class Node(BaseNode):
+    def __init__(self, name, attributes=()):
+        self.name = name
+        self.attributes = OrderedDict(attributes)
+        self.children = []
+        self.parent = None
+
+
+    def attribute_items(self):
+        return self.attributes.items()
+
+
+    def append_child(self, node):
+        self.children.append(node)
+
+
+class CompactNode(BaseNode):
+    """
+    An element node with a much smaller memory footprint than `Node`.
+
+    The attributes are kept as a tuple of (name, value) pairs, which can be
+    shared between nodes, rather than an `OrderedDict`. Leaf nodes don't get a
+    children list; it is only created when the first child is appended.
+
+    The attributes are set when the node is created. `attributes` returns a
+    copy as an `OrderedDict`, so use `set_attribute` to change them.
+    """
+    __slots__ = ('name', 'attribute_pairs', 'children', 'parent')
+
+    def __init__(self, name, attributes=()):
+        self.name = name
+        self.attribute_pairs = tuple(attributes)
+        self.children = ()
+        self.parent = None
+
+
+    def attribute_items(self):
+        return self.attribute_pairs
+
+
+    @property
+    def attributes(self):
+        return OrderedDict(self.attribute_pairs)
+
+
+    def set_attribute(self, name, value):
+        pairs = list(self.attribute_pairs)
+        for index, (key, _) in enumerate(pairs):
+            if key == name:
+                pairs[index] = (name, value)
+                break
+        else:
+            pairs.append((name, value))
+        self.attribute_pairs = tuple(pairs)
+
+
+    def append_child(self, node):
+        if self.children:
+            self.children.append(node)
+        else:
+            self.children = [node]
 
 
 class TextNode(object):
+    __slots__ = ('data',)
     
     def __init__(self, data):
         self.data = data
@@ -62,6 +159,14 @@ class TextNode(object):
     __hash__ = None
 
 
+    def iter_chunks(self):
+        yield self.data
+
+
+    def write(self, out):
+        out.write(self.data)
+
+
     def to_string(self):
         return self.data
 
@@ -72,3 +177,4 @@ class TextNode(object):
 
 class ErrorNode(Node):
     pass
+
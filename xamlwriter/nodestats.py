@@ -0,0 +1,101 @@
+"""
+Per node type statistics for the translator, collected when profiling is
+switched on with `XamlTranslator.enable_profiling`.
+"""
+
+from xamlwriter.node import TextNode
+
+__all__ = ['ElementCounter', 'NodeStats']
+
+
+class NodeStats(object):
+    """
+    Counts of the docutils nodes translated, by class name, the time spent
+    in their visit and depart handlers, and counts of the XAML elements
+    written, by tag.
+
+    `dropped` counts the nodes that were handled by `unknown_visit`, so
+    they (but not necessarily their children) are missing from the XAML.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.visit_time = {}
+        self.depart_time = {}
+        self.dropped = {}
+        self.elements = {}
+
+
+    def add_visit(self, name, seconds, dropped=False):
+        self.nodes[name] = self.nodes.get(name, 0) + 1
+        self.visit_time[name] = self.visit_time.get(name, 0.0) + seconds
+        if dropped:
+            self.dropped[name] = self.dropped.get(name, 0) + 1
+
+
+    def add_departure(self, name, seconds):
+        self.depart_time[name] = self.depart_time.get(name, 0.0) + seconds
+
+
+    def add_element(self, tagname):
+        self.elements[tagname] = self.elements.get(tagname, 0) + 1
+
+
+    def count_elements(self, root):
+        """Count the elements of the XAML node tree `root`."""
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, TextNode):
+                continue
+            self.add_element(node.name)
+            stack.extend(node.children)
+
+
+    def time(self, name):
+        """The total time spent in the handlers for the node class `name`."""
+        return self.visit_time.get(name, 0.0) + self.depart_time.get(name, 0.0)
+
+
+    def report(self):
+        """Return a breakdown as a list of lines, most expensive first."""
+        lines = ['%-24s %8s %10s %10s %14s' % ('node class', 'count',
+            'visit (s)', 'depart (s)', 'per node (us)')]
+        names = sorted(self.nodes, key=self.time, reverse=True)
+        for name in names:
+            count = self.nodes[name]
+            lines.append('%-24s %8d %10.4f %10.4f %14.2f' % (name, count,
+                self.visit_time.get(name, 0.0), self.depart_time.get(name, 0.0),
+                self.time(name) / count * 1e6))
+        if self.dropped:
+            lines.append('Dropped by unknown_visit: ' + ', '.join(
+                '%s (%d)' % item for item in sorted(self.dropped.items())))
+        elements = sorted(self.elements.items(),
+                          key=lambda item: (-item[1], item[0]))
+        lines.append('XAML elements: ' + ', '.join(
+            '%s (%d)' % item for item in elements))
+        return lines
+
+
+class ElementCounter(object):
+    """
+    An event handler (see `xamlwriter.events`) that counts the elements in
+    `stats` and passes the events on to `handler`.
+    """
+
+    def __init__(self, handler, stats):
+        self.handler = handler
+        self.stats = stats
+
+
+    def start_element(self, name, attributes):
+        self.stats.add_element(name)
+        self.handler.start_element(name, attributes)
+
+
+    def text(self, data):
+        self.handler.text(data)
+
+
+    def end_element(self, name):
+        self.handler.end_element(name)
@@ -1,20 +1,33 @@
 
-from pygments import highlight
-from pygments.lexers import get_lexer_by_name, TextLexer
+import time
 
 from docutils import nodes
 from docutils.parsers.rst import directives
 
-from xamlwriter.xamlformatter import XamlFormatter
+from xamlwriter.highlight import code_block, highlight_code
+from xamlwriter.walker import iter_nodes
 
-# set externally to configure whether FlowDocument or Silverlight
-# XAML is to be output
+# Defaults for whether FlowDocument or Silverlight XAML is to be output and
+# whether code blocks are stored. Each conversion can set its own values
+# through the docutils settings 'xaml_flowdocument' and
+# 'xaml_store_code_blocks' (`XamlWriter` and `publish_xaml` do this), so
+# conversions in different modes can run at the same time.
 flowdocument = True
-
-# set externally to configure if code blocks are stored
 store_code_blocks = False
+
+# Stored code blocks go into the list in the 'xaml_code_blocks' setting
+# (one string per block), which `publish_xaml_ex` creates for every
+# conversion. Without that setting they are added to this list (as lists of
+# lines), which is never emptied.
 code_blocks = []
 
+
+def get_setting(settings, name, default):
+    value = getattr(settings, name, None)
+    if value is None:
+        return default
+    return value
+
 def process_lines(lines):
     output = []
     for line in lines:
@@ -22,24 +35,62 @@ def process_lines(lines):
             output.append(line[4:])
     return output
 
+def collect_code_block(language, lines, document_code_blocks=None):
+    """
+    Store the lines of a python or pycon code block in `document_code_blocks`
+    (as one string), or in `code_blocks` if that is None.
+    """
+    if language == 'python':
+        lines = list(lines)
+    elif language == 'pycon':
+        lines = process_lines(lines)
+    else:
+        return
+    if document_code_blocks is None:
+        code_blocks.append(lines)
+    else:
+        document_code_blocks.append(u'\n'.join(lines))
+
+def collect_code_blocks(document, document_code_blocks=None):
+    """
+    Store the deferred code blocks of a doctree from
+    `xamlwriter.writer.get_doctree` that were parsed with code blocks
+    stored, as the directive does while parsing. Used for doctrees that
+    come from a cache rather than the parser.
+    """
+    for node in iter_nodes(document, code_block):
+        if node['store_code_blocks']:
+            collect_code_block(node['language'], node.astext().split('\n'),
+                               document_code_blocks)
+
 def pygments_directive(name, arguments, options, content, lineno,
                        content_offset, block_text, state, state_machine):
-    if store_code_blocks:
-        if arguments[0] == 'python':
-            code_blocks.append(list(content))
-        elif arguments[0] == 'pycon':
-            code_blocks.append(process_lines(list(content)))
+    settings = state.document.settings
+    flowdocument_setting = get_setting(settings, 'xaml_flowdocument', flowdocument)
+    store_code_blocks_setting = get_setting(settings, 'xaml_store_code_blocks',
+                                            store_code_blocks)
+    style_resources = get_setting(settings, 'xaml_style_resources', False)
+    if store_code_blocks_setting:
+        collect_code_block(arguments[0], list(content),
+                           getattr(settings, 'xaml_code_blocks', None))
+    if get_setting(settings, 'xaml_defer_code_blocks', False):
+        # highlighted when the doctree is written, see `get_doctree`
+        code = u'\n'.join(content)
+        return [code_block(code, code, language=arguments[0],
+                           store_code_blocks=store_code_blocks_setting)]
     #print 'working on'
     #print '\n'.join(content)
-    try:
-        lexer = get_lexer_by_name(arguments[0])
-    except ValueError:
-        # no lexer found - use the text one instead of an exception
-        lexer = TextLexer()
-    # take an arbitrary option if more than one is given
-    formatter = XamlFormatter(flowdocument=flowdocument, 
-                              store_code_blocks=store_code_blocks)
-    parsed = highlight(u'\n'.join(content), lexer, formatter)
+    # a `xamlwriter.timings.Timings`, from `publish_xaml_timed`
+    timings = getattr(settings, 'xaml_timings', None)
+    if timings is not None:
+        start = time.time()
+    parsed = highlight_code(arguments[0], u'\n'.join(content),
+                            flowdocument=flowdocument_setting,
+                            store_code_blocks=store_code_blocks_setting,
+                            style_resources=style_resources)
+    if timings is not None:
+        timings.add_code_block(arguments[0], len(content),
+                               time.time() - start)
     return [nodes.raw('', parsed, format='xaml')]
 
 pygments_directive.arguments = (1, 0, 1)
@@ -0,0 +1,182 @@
+import codecs
+import os
+import shutil
+import tempfile
+import unittest
+
+from xamlwriter.batch import publish_xaml_many
+from xamlwriter.cli import find_sources
+from xamlwriter.writer import publish_xaml
+
+# This installs the pygments directive
+import xamlwriter.register_directive
+
+
+SOURCES = {
+    'one.txt': u'Hello *world*\n',
+    'two.rst': u'* a list\n* of two\n\n.. code-block:: python\n\n    x = 1\n',
+}
+
+
+class TestPublishXamlMany(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.paths = []
+        for name, source in sorted(SOURCES.items()):
+            path = os.path.join(self.directory, name)
+            handle = codecs.open(path, 'w', 'utf-8')
+            handle.write(source)
+            handle.close()
+            self.paths.append(path)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def check_output(self, results, flowdocument=True):
+        self.assertEqual(sorted(result[0] for result in results), self.paths)
+        for input_path, output_path, seconds, cached, error in results:
+            self.assertEqual(error, None)
+            self.assertEqual(output_path, os.path.splitext(input_path)[0] + '.xaml')
+            self.assertTrue(seconds >= 0)
+            source = SOURCES[os.path.basename(input_path)]
+            expected = publish_xaml(source, flowdocument=flowdocument)
+            self.assertEqual(codecs.open(output_path, 'r', 'utf-8').read(), expected)
+
+
+    def testInProcess(self):
+        reported = []
+        results = publish_xaml_many(self.paths, jobs=1, report=reported.append)
+        self.assertEqual(reported, results)
+        self.check_output(results)
+
+
+    def testWorkerProcesses(self):
+        results = publish_xaml_many(self.paths, jobs=2, flowdocument=False)
+        self.check_output(results, flowdocument=False)
+
+
+    def testHighlightJobs(self):
+        cache_dir = os.path.join(self.directory, 'cache')
+        for flowdocument in (True, False):
+            results = publish_xaml_many(self.paths, highlight_jobs=2,
+                                        flowdocument=flowdocument,
+                                        cache_dir=cache_dir)
+            self.check_output(results, flowdocument=flowdocument)
+            self.assertEqual([result[3] for result in results], [False, False])
+        results = publish_xaml_many(self.paths, highlight_jobs=2,
+                                    cache_dir=cache_dir)
+        self.check_output(results)
+        self.assertEqual([result[3] for result in results], [True, True])
+    
+    
+    def testHighlightJobsParsedByWorkers(self):
+        missing = os.path.join(self.directory, 'missing.txt')
+        for jobs in (1, 2):
+            results = publish_xaml_many(self.paths + [missing], jobs=jobs,
+                                        highlight_jobs=2, flowdocument=False)
+            errors = dict((result[0], result[4]) for result in results)
+            self.assertTrue(errors.pop(missing).startswith('IOError'))
+            self.check_output([result for result in results
+                               if result[0] != missing], flowdocument=False)
+
+
+    def testFailures(self):
+        missing = os.path.join(self.directory, 'missing.txt')
+        bad = os.path.join(self.directory, 'bad.txt')
+        handle = open(bad, 'wb')
+        handle.write('\xff not utf-8')
+        handle.close()
+        existing = os.path.join(self.directory, 'bad.xaml')
+        handle = open(existing, 'w')
+        handle.write('old')
+        handle.close()
+        for jobs in (1, 2):
+            results = publish_xaml_many(self.paths + [missing, bad], jobs=jobs)
+            errors = dict((result[0], result[4]) for result in results)
+            self.assertEqual(errors[self.paths[0]], None)
+            self.assertEqual(errors[self.paths[1]], None)
+            self.assertTrue(errors[missing].startswith('IOError'))
+            self.assertTrue(errors[bad].startswith('UnicodeDecodeError'))
+            self.check_output([result for result in results
+                               if result[4] is None])
+            # the output of a failed conversion is left alone
+            self.assertFalse(os.path.exists(os.path.join(self.directory,
+                                                         'missing.xaml')))
+            self.assertEqual(open(existing).read(), 'old')
+            self.assertEqual(sorted(os.listdir(self.directory)),
+                             ['bad.txt', 'bad.xaml', 'one.txt', 'one.xaml',
+                              'two.rst', 'two.xaml'])
+
+
+    def testHighlightingFailure(self):
+        from xamlwriter import highlight
+        bad = os.path.join(self.directory, 'bad.txt')
+        handle = open(bad, 'w')
+        handle.write('.. code-block:: python\n\n    boom\n')
+        handle.close()
+        
+        def failing_highlight(language, code, formatter, tokens):
+            if code == u'boom':
+                raise ValueError('cannot highlight')
+            return original(language, code, formatter, tokens)
+        original = highlight._highlight
+        cache = highlight.highlight_cache
+        highlight._highlight = failing_highlight
+        highlight.highlight_cache = None
+        try:
+            results = publish_xaml_many(self.paths + [bad], jobs=1,
+                                        highlight_jobs=1)
+        finally:
+            highlight._highlight = original
+            highlight.highlight_cache = cache
+        errors = dict((result[0], result[4]) for result in results)
+        self.assertEqual(errors.pop(bad), 'ValueError: cannot highlight')
+        self.check_output([result for result in results if result[0] != bad])
+    
+    
+    def testMessagesSameAsPublishXaml(self):
+        sources = {'info.txt': u'A\n=\n\nx\n\nB\n=\n\nA\n-\n\ny\n',
+                   'error.txt': u'para\n\nbad ref_\n'}
+        paths = []
+        for name, source in sorted(sources.items()):
+            path = os.path.join(self.directory, name)
+            handle = codecs.open(path, 'w', 'utf-8')
+            handle.write(source)
+            handle.close()
+            paths.append(path)
+        overrides = {'warning_stream': False}
+        results = publish_xaml_many(paths, jobs=1, highlight_jobs=1,
+                                    overrides=overrides)
+        self.assertEqual([result[4] for result in results], [None, None])
+        for path in paths:
+            source = sources[os.path.basename(path)]
+            self.assertEqual(
+                codecs.open(path[:-4] + '.xaml', 'r', 'utf-8').read(),
+                publish_xaml(source, overrides=overrides))
+            self.assertEqual(publish_xaml(source, overrides=overrides,
+                                          highlight_jobs=1),
+                             publish_xaml(source, overrides=overrides))
+
+
+    def testOutputPaths(self):
+        output = os.path.join(self.directory, 'output.xaml')
+        results = publish_xaml_many([(self.paths[0], output)], jobs=1)
+        self.assertEqual(results[0][:2], (self.paths[0], output))
+        self.assertTrue(os.path.isfile(output))
+
+
+    def testFindSources(self):
+        open(os.path.join(self.directory, 'ignored.py'), 'w').close()
+        output_dir = os.path.join('out', 'put')
+        self.assertEqual(find_sources(self.directory, output_dir), [
+            (self.paths[0], os.path.join(output_dir, 'one.xaml')),
+            (self.paths[1], os.path.join(output_dir, 'two.xaml')),
+        ])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
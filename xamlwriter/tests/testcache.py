@@ -0,0 +1,240 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from docutils import nodes
+
+from xamlwriter import cache as cache_module
+from xamlwriter.cache import (DoctreeCache, LRUCache, RenderCache, doctree_key,
+                              render_key)
+from xamlwriter.highlight import code_block
+from xamlwriter.writer import (get_doctree, publish_xaml, publish_xaml_ex,
+                               write_doctree)
+
+
+class TestRenderKey(unittest.TestCase):
+
+    def testKey(self):
+        key = render_key(u'Hello')
+        self.assertEqual(key, render_key('Hello'))
+        self.assertNotEqual(key, render_key(u'Hello!'))
+        self.assertNotEqual(key, render_key(u'Hello', flowdocument=False))
+        self.assertNotEqual(key, render_key(u'Hello', xclass=False))
+        self.assertNotEqual(key, render_key(u'Hello', overrides={'foo': 1}))
+        self.assertNotEqual(key, render_key(u'Hello', style_resources=True))
+
+
+    def testCodeChanges(self):
+        key = render_key(u'Hello')
+        saved = cache_module.CACHE_FORMAT
+        cache_module.CACHE_FORMAT = 'changed'
+        try:
+            self.assertNotEqual(render_key(u'Hello'), key)
+        finally:
+            cache_module.CACHE_FORMAT = saved
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def testGetAndSet(self):
+        cache = LRUCache()
+        self.assertEqual(cache.get('key'), None)
+        cache.set('key', 'value')
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertEqual(len(cache), 1)
+
+
+    def testEvictsLeastRecentlyUsed(self):
+        cache = LRUCache(max_entries=4)
+        for key in 'abcd':
+            cache.set(key, key)
+        cache.get('a')
+        cache.set('e', 'e')
+        # the least recently used entries are dropped, down to three
+        # quarters of the maximum
+        self.assertEqual(sorted(cache.entries), ['a', 'd', 'e'])
+
+
+class TestRenderCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def testGetAndSet(self):
+        cache = RenderCache(self.directory)
+        self.assertEqual(cache.get('key'), None)
+        cache.set('key', u'<foo>\u2022</foo>')
+        self.assertEqual(cache.get('key'), u'<foo>\u2022</foo>')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        
+        # a new cache object sees the stored entries
+        self.assertEqual(RenderCache(self.directory).get('key'), u'<foo>\u2022</foo>')
+
+
+    def testCreatesDirectory(self):
+        directory = os.path.join(self.directory, 'sub', 'dir')
+        RenderCache(directory)
+        self.assertTrue(os.path.isdir(directory))
+
+
+    def testReplacedEntrySize(self):
+        cache = RenderCache(self.directory, max_size=25)
+        cache.set('other', 'x' * 10)
+        for _ in range(5):
+            cache.set('key', 'x' * 10)
+        self.assertEqual(cache.size, 20)
+        self.assertEqual(cache.get('other'), 'x' * 10)
+
+
+    def testEvictsLeastRecentlyUsed(self):
+        cache = RenderCache(self.directory, max_size=25)
+        cache.set('one', 'x' * 10)
+        cache.set('two', 'x' * 10)
+        # make 'one' the most recently used entry
+        past = time.time() - 100
+        os.utime(cache.path_for('two'), (past, past))
+        
+        cache.set('three', 'x' * 10)
+        self.assertEqual(cache.get('two'), None)
+        self.assertEqual(cache.get('one'), 'x' * 10)
+        self.assertEqual(cache.get('three'), 'x' * 10)
+        self.assertEqual(cache.size, 20)
+
+
+    def testPublishXaml(self):
+        cache = RenderCache(self.directory)
+        expected = publish_xaml('Hello *world*')
+        self.assertEqual(publish_xaml('Hello *world*', cache=cache), expected)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        self.assertEqual(publish_xaml('Hello *world*', cache=cache), expected)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        
+        self.assertNotEqual(publish_xaml('Hello *world*', flowdocument=False,
+                                         cache=cache), expected)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+
+
+CODE_SOURCE = """\
+Code
+====
+
+.. code-block:: python
+
+    def function(arg):
+        return arg * 2
+"""
+
+
+# sources with system messages: an INFO message that is filtered out, and an
+# error that is collected into a "Docutils System Messages" section
+MESSAGE_SOURCES = [
+    u'A\n=\n\nx\n\nB\n=\n\nA\n-\n\ny\n',
+    u'para\n\nbad ref_\n',
+]
+
+QUIET = {'warning_stream': False}
+
+
+class TestDoctreeCache(unittest.TestCase):
+
+    def setUp(self):
+        # This installs the pygments directive
+        import xamlwriter.register_directive
+        self.directory = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def testKey(self):
+        key = doctree_key(u'Hello')
+        self.assertEqual(key, doctree_key('Hello'))
+        self.assertNotEqual(key, doctree_key(u'Hello', store_code_blocks=True))
+        self.assertNotEqual(key, render_key(u'Hello'))
+        
+        saved = cache_module.CACHE_FORMAT
+        cache_module.CACHE_FORMAT = 'changed'
+        try:
+            self.assertNotEqual(doctree_key(u'Hello'), key)
+        finally:
+            cache_module.CACHE_FORMAT = saved
+
+
+    def testBothModesFromOneParse(self):
+        cache = DoctreeCache(self.directory)
+        for flowdocument in (True, False, True, False):
+            self.assertEqual(publish_xaml(CODE_SOURCE, flowdocument=flowdocument,
+                                          doctree_cache=cache),
+                             publish_xaml(CODE_SOURCE, flowdocument=flowdocument))
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+        self.assertEqual(len(cache.entries()), 1)
+
+
+    def testCodeBlocksDeferred(self):
+        document = get_doctree(CODE_SOURCE)
+        self.assertEqual(len(document.traverse(nodes.raw)), 0)
+        blocks = document.traverse(code_block)
+        self.assertEqual(len(blocks), 1)
+        self.assertEqual(blocks[0]['language'], 'python')
+        
+        # the doctree can be written more than once
+        for flowdocument in (False, True):
+            self.assertEqual(write_doctree(document, flowdocument=flowdocument),
+                             publish_xaml(CODE_SOURCE, flowdocument=flowdocument))
+
+
+    def testCodeBlocksStoredFromCache(self):
+        cache = DoctreeCache(self.directory)
+        source = CODE_SOURCE + '\n.. code-block:: pycon\n\n    >>> y = 2\n'
+        expected = publish_xaml_ex(source)
+        for _ in range(2):
+            code_blocks = []
+            xaml = publish_xaml(source, overrides={'xaml_code_blocks': code_blocks},
+                                store_code_blocks=True, doctree_cache=cache)
+            self.assertEqual((xaml, tuple(code_blocks)), expected)
+        self.assertEqual(cache.hits, 1)
+
+
+    def testSystemMessages(self):
+        cache = DoctreeCache(self.directory)
+        for source in MESSAGE_SOURCES:
+            for flowdocument in (True, False):
+                expected = publish_xaml(source, flowdocument=flowdocument,
+                                        overrides=QUIET)
+                document = get_doctree(source, overrides=QUIET)
+                self.assertEqual(write_doctree(document,
+                                               flowdocument=flowdocument,
+                                               overrides=QUIET), expected)
+                # written again, and from the cache
+                self.assertEqual(write_doctree(document,
+                                               flowdocument=flowdocument,
+                                               overrides=QUIET), expected)
+                for _ in range(2):
+                    self.assertEqual(publish_xaml(source,
+                                                  flowdocument=flowdocument,
+                                                  overrides=QUIET,
+                                                  doctree_cache=cache),
+                                     expected)
+
+
+    def testStyleResources(self):
+        cache = DoctreeCache(self.directory)
+        publish_xaml(CODE_SOURCE, doctree_cache=cache)
+        self.assertEqual(publish_xaml(CODE_SOURCE, style_resources=True,
+                                      doctree_cache=cache),
+                         publish_xaml(CODE_SOURCE, style_resources=True))
+        self.assertEqual(cache.hits, 1)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
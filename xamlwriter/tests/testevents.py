@@ -0,0 +1,53 @@
+import unittest
+from StringIO import StringIO
+
+from xamlwriter.events import EventBuffer, XamlEmitter
+
+
+class TestXamlEmitter(unittest.TestCase):
+
+    def testEmptyElement(self):
+        out = StringIO()
+        emitter = XamlEmitter(out)
+        emitter.start_element('foo', [('bar', 'baz')])
+        emitter.end_element('foo')
+        self.assertEqual(out.getvalue(), '<foo bar="baz" />')
+
+
+    def testChildren(self):
+        out = StringIO()
+        emitter = XamlEmitter(out)
+        emitter.start_element('foo', ())
+        emitter.text('text')
+        emitter.start_element('bar', ())
+        emitter.end_element('bar')
+        emitter.end_element('foo')
+        self.assertEqual(out.getvalue(), '<foo>text<bar /></foo>')
+
+
+    def testEmptyText(self):
+        out = StringIO()
+        emitter = XamlEmitter(out)
+        emitter.start_element('foo', ())
+        emitter.text('')
+        emitter.end_element('foo')
+        self.assertEqual(out.getvalue(), '<foo></foo>')
+
+
+class TestEventBuffer(unittest.TestCase):
+
+    def testReplay(self):
+        buffer = EventBuffer()
+        buffer.start_element('foo', ())
+        buffer.text('text')
+        buffer.end_element('foo')
+        
+        out = StringIO()
+        buffer.replay(XamlEmitter(out))
+        self.assertEqual(out.getvalue(), '<foo>text</foo>')
+        self.assertEqual(buffer.events, [])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
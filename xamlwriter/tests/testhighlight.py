@@ -0,0 +1,267 @@
+import shutil
+import tempfile
+import threading
+import unittest
+from StringIO import StringIO
+
+from pygments import highlight
+from pygments.lexers import PythonLexer, TextLexer
+from pygments.token import Comment, Text
+
+from docutils import nodes
+
+from xamlwriter import highlight as highlight_module
+from xamlwriter.highlight import (HighlightCache, code_block, get_formatter,
+                                  get_lexer, highlight_code,
+                                  highlight_code_blocks)
+from xamlwriter.writer import get_doctree, publish_xaml, write_doctree
+from xamlwriter.xamlformatter import XamlFormatter
+
+
+class TestCaches(unittest.TestCase):
+
+    def testLexerCache(self):
+        lexer = get_lexer('python')
+        self.assertTrue(isinstance(lexer, PythonLexer))
+        self.assertTrue(get_lexer('python') is lexer)
+        self.assertTrue(get_lexer('python', stripnl=False) is not lexer)
+
+
+    def testUnknownLanguage(self):
+        self.assertTrue(isinstance(get_lexer('no-such-language'), TextLexer))
+
+
+    def testFormatterCache(self):
+        formatter = get_formatter()
+        self.assertTrue(get_formatter() is formatter)
+        self.assertTrue(get_formatter(flowdocument=False) is not formatter)
+        self.assertFalse(get_formatter(flowdocument=False).flowdocument)
+        self.assertTrue(get_formatter(store_code_blocks=True).store_code_blocks)
+
+
+    def testStyleTableShared(self):
+        first = XamlFormatter(flowdocument=False)
+        second = XamlFormatter(flowdocument=False)
+        self.assertTrue(first.styles is second.styles)
+        self.assertNotEqual(first.start, XamlFormatter().start)
+
+
+    def testRunTableShared(self):
+        first = XamlFormatter()
+        self.assertTrue(XamlFormatter(flowdocument=False).runs is first.runs)
+        self.assertEqual(first.runs[Comment], '<Run%s>' % first.styles[Comment])
+
+
+    def testRunForUnknownTokenType(self):
+        formatter = XamlFormatter()
+        ttype = Comment.Something.Unknown
+        self.assertFalse(ttype in formatter.styles)
+        self.assertEqual(formatter._get_run(ttype), formatter.runs[Comment])
+        self.assertTrue(ttype in formatter.runs)
+
+
+    def testTrailingSeparator(self):
+        formatter = XamlFormatter(flowdocument=False)
+        tokens = [(Text, u'a\n'), (Text, u'\n'), (Comment, u'# b\n\n')]
+        out = StringIO()
+        formatter.format(tokens, out)
+        expected = (formatter.start + '<Run>a</Run><LineBreak /><LineBreak />' +
+                    '<Run%s>#&#0160;b</Run><LineBreak />' % formatter.styles[Comment] +
+                    formatter.end)
+        self.assertEqual(out.getvalue(), expected)
+
+
+    def testLinesAreStreamed(self):
+        formatter = XamlFormatter()
+        out = StringIO()
+        def tokens():
+            yield Text, u'first\n'
+            # the first line is out before the rest of the source is read
+            self.assertEqual(out.getvalue(), formatter.start + '<Run>first</Run>')
+            yield Text, u'second'
+        formatter.format(tokens(), out)
+        self.assertEqual(out.getvalue(), formatter.start +
+                         '<Run>first</Run>\n<Run>second</Run>' + formatter.end)
+
+
+    def testHighlightCode(self):
+        code = u'def f(x):\n    return "<%s>" % x\n'
+        for flowdocument in (True, False):
+            for store_code_blocks in (True, False):
+                formatter = XamlFormatter(flowdocument=flowdocument,
+                                          store_code_blocks=store_code_blocks)
+                expected = highlight(code, PythonLexer(), formatter)
+                self.assertEqual(highlight_code('python', code, flowdocument,
+                                                store_code_blocks), expected)
+
+
+class TestHighlightCache(unittest.TestCase):
+
+    def setUp(self):
+        self.old_cache = highlight_module.highlight_cache
+        self.directory = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        highlight_module.highlight_cache = self.old_cache
+        shutil.rmtree(self.directory)
+
+
+    def testKey(self):
+        cache = HighlightCache()
+        key = cache.key('python', u'x = 1', True, False)
+        self.assertEqual(key, cache.key('python', 'x = 1', True, False))
+        self.assertNotEqual(key, cache.key('python', u'x = 2', True, False))
+        self.assertNotEqual(key, cache.key('ruby', u'x = 1', True, False))
+        self.assertNotEqual(key, cache.key('python', u'x = 1', False, False))
+        self.assertNotEqual(key, cache.key('python', u'x = 1', True, True))
+        
+        saved = highlight_module.CACHE_FORMAT
+        highlight_module.CACHE_FORMAT = 'changed'
+        try:
+            self.assertNotEqual(key, cache.key('python', u'x = 1', True, False))
+        finally:
+            highlight_module.CACHE_FORMAT = saved
+
+
+    def testCountersFromThreads(self):
+        cache = HighlightCache()
+        cache.set('key', u'<Run />')
+        def lookup():
+            for _ in range(2000):
+                cache.get('key')
+                cache.get('missing')
+        threads = [threading.Thread(target=lookup) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((cache.hits, cache.misses), (8000, 8000))
+
+
+    def testDiskTierFromThreads(self):
+        cache = HighlightCache(directory=self.directory)
+        def store(number):
+            for index in range(50):
+                key = 'key%d' % (index % 10)
+                cache.set(key, u'x' * 10)
+                cache.get('missing%d' % number)
+        threads = [threading.Thread(target=store, args=(number,))
+                   for number in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(cache.misses, 200)
+        self.assertEqual(cache.disk.size, cache.disk.total_size())
+
+
+    def testHighlightCodeUsesCache(self):
+        cache = highlight_module.highlight_cache = HighlightCache()
+        expected = highlight(u'x = 1', PythonLexer(), XamlFormatter())
+        self.assertEqual(highlight_code('python', u'x = 1'), expected)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        self.assertEqual(highlight_code('python', u'x = 1'), expected)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        highlight_code('python', u'x = 1', flowdocument=False)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+
+    def testNoCache(self):
+        highlight_module.highlight_cache = None
+        expected = highlight(u'x = 1', PythonLexer(), XamlFormatter())
+        self.assertEqual(highlight_code('python', u'x = 1'), expected)
+
+
+    def testPersistentTier(self):
+        cache = highlight_module.highlight_cache = HighlightCache(directory=self.directory)
+        expected = highlight_code('python', u'x = 1')
+        
+        # a new process would start with an empty memory cache
+        cache = highlight_module.highlight_cache = HighlightCache(directory=self.directory)
+        self.assertEqual(highlight_code('python', u'x = 1'), expected)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+        self.assertEqual(cache.disk.hits, 1)
+        self.assertEqual(len(cache.memory), 1)
+
+
+
+CODE_SOURCE = u"""\
+.. code-block:: python
+
+    x = 1
+
+Text.
+
+.. code-block:: python
+
+    x = 1
+
+.. code-block:: pycon
+
+    >>> y = 2
+"""
+
+
+class TestHighlightCodeBlocks(unittest.TestCase):
+
+    def setUp(self):
+        # This installs the pygments directive
+        import xamlwriter.register_directive
+        self.old_cache = highlight_module.highlight_cache
+        highlight_module.highlight_cache = HighlightCache()
+
+
+    def tearDown(self):
+        highlight_module.highlight_cache = self.old_cache
+
+
+    def testReplacedWithRawXaml(self):
+        for jobs in (1, 2):
+            for flowdocument in (True, False):
+                highlight_module.highlight_cache = HighlightCache()
+                document = get_doctree(CODE_SOURCE)
+                self.assertEqual(highlight_code_blocks(
+                    [document], flowdocument=flowdocument, jobs=jobs), 2)
+                self.assertEqual(len(document.traverse(code_block)), 0)
+                self.assertEqual(len(document.traverse(nodes.raw)), 3)
+                self.assertEqual(write_doctree(document,
+                                               flowdocument=flowdocument),
+                                 publish_xaml(CODE_SOURCE,
+                                              flowdocument=flowdocument))
+
+
+    def testBatchUsesCache(self):
+        documents = [get_doctree(CODE_SOURCE), get_doctree(CODE_SOURCE)]
+        self.assertEqual(highlight_code_blocks(documents, jobs=2), 2)
+        self.assertEqual(highlight_code_blocks([get_doctree(CODE_SOURCE)],
+                                               jobs=2), 0)
+    
+    
+    def testPublishXaml(self):
+        for style_resources in (False, True):
+            self.assertEqual(publish_xaml(CODE_SOURCE, highlight_jobs=2,
+                                          style_resources=style_resources),
+                             publish_xaml(CODE_SOURCE,
+                                          style_resources=style_resources))
+    
+    
+    def testExistingPool(self):
+        import multiprocessing
+        pool = multiprocessing.Pool(2)
+        try:
+            for flowdocument in (True, False, True):
+                highlight_module.highlight_cache = HighlightCache()
+                self.assertEqual(publish_xaml(CODE_SOURCE,
+                                              flowdocument=flowdocument,
+                                              highlight_pool=pool),
+                                 publish_xaml(CODE_SOURCE,
+                                              flowdocument=flowdocument))
+        finally:
+            pool.close()
+            pool.join()
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+
+# This installs the pygments directive
+import xamlwriter.register_directive
+
+from xamlwriter.incremental import IncrementalPublisher, fingerprint, split_parts
+from xamlwriter.writer import XamlPublisher, publish_xaml
+
+from xamlwriter.tests.testxamlwriter import STREAMING_SOURCE
+
+
+SOURCE = """\
+Title
+=====
+
+Introduction with a footnote [#]_.
+
+First
+-----
+
+Some *text* in the first section.
+
+.. code-block:: python
+
+    x = 1
+
+Second
+------
+
+* one
+* two
+
+Third
+-----
+
+Text with a footnote [#]_.
+
+.. [#] The first footnote.
+.. [#] The second footnote.
+"""
+
+
+class TestSplitParts(unittest.TestCase):
+
+    def testParts(self):
+        document = XamlPublisher().read(SOURCE)
+        parts = split_parts(document)
+        self.assertEqual([node.tagname for part in parts for node in part],
+                         [node.tagname for node in document.children])
+        self.assertEqual([part[0].tagname for part in parts],
+                         ['title', 'section', 'section', 'section'])
+
+
+    def testFingerprint(self):
+        publisher = XamlPublisher()
+        parts = split_parts(publisher.read(SOURCE))
+        again = split_parts(publisher.read(SOURCE))
+        self.assertEqual([fingerprint(part) for part in parts],
+                         [fingerprint(part) for part in again])
+        edited = split_parts(publisher.read(SOURCE.replace('*text*', 'text')))
+        self.assertNotEqual(fingerprint(parts[1]), fingerprint(edited[1]))
+        self.assertEqual(fingerprint(parts[2]), fingerprint(edited[2]))
+
+
+
+class TestIncrementalPublisher(unittest.TestCase):
+
+    def testSameAsPublishXaml(self):
+        for source in (SOURCE, STREAMING_SOURCE, u'', u'Just text'):
+            for flowdocument in (True, False):
+                for style_resources in (False, True):
+                    publisher = IncrementalPublisher(
+                        flowdocument=flowdocument,
+                        style_resources=style_resources)
+                    expected = publish_xaml(source, flowdocument=flowdocument,
+                                            style_resources=style_resources)
+                    self.assertEqual(publisher.publish(source), expected)
+                    self.assertEqual(publisher.publish(source), expected)
+
+
+    def testOnlyChangedSectionsTranslated(self):
+        publisher = IncrementalPublisher()
+        publisher.publish(SOURCE)
+        self.assertEqual((publisher.translated, publisher.reused), (4, 0))
+        publisher.publish(SOURCE)
+        self.assertEqual((publisher.translated, publisher.reused), (0, 4))
+
+        edited = SOURCE.replace('* two', '* two and a half')
+        self.assertEqual(publisher.publish(edited), publish_xaml(edited))
+        self.assertEqual((publisher.translated, publisher.reused), (1, 3))
+
+
+    def testCrossSectionChanges(self):
+        # a new footnote before the third section renumbers its footnote
+        publisher = IncrementalPublisher()
+        publisher.publish(SOURCE)
+        edited = SOURCE.replace('* one', '* one [#]_').replace(
+            '.. [#] The second', '.. [#] New.\n.. [#] The second')
+        self.assertEqual(publisher.publish(edited), publish_xaml(edited))
+        self.assertEqual(publisher.translated, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
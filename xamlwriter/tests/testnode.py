@@ -1,6 +1,9 @@
+import sys
 import unittest
 
-from xamlwriter.node import ErrorNode, Node, OrderedDict, TextNode
+from StringIO import StringIO
+
+from xamlwriter.node import CompactNode, ErrorNode, Node, OrderedDict, TextNode
 
 
 class TestNode(unittest.TestCase):
@@ -60,6 +63,84 @@ class TestNode(unittest.TestCase):
         self.assertEqual(node.to_string(), '<foo bar="baz" />')
 
 
+    def testWrite(self):
+        node = Node('foo')
+        node.attributes['bar'] = 'baz'
+        node.children.append(TextNode('text'))
+        node.children.append(Node('bar'))
+        out = StringIO()
+        node.write(out)
+        self.assertEqual(out.getvalue(), '<foo bar="baz">text<bar /></foo>')
+        self.assertEqual(out.getvalue(), node.to_string())
+
+
+    def testToStringDeeplyNested(self):
+        depth = sys.getrecursionlimit() * 2
+        root = node = Node('foo')
+        for _ in range(depth - 1):
+            child = Node('foo')
+            node.children.append(child)
+            node = child
+        node.children.append(TextNode('bar'))
+        expected = '<foo>' * depth + 'bar' + '</foo>' * depth
+        self.assertEqual(root.to_string(), expected)
+
+
+class TestCompactNode(unittest.TestCase):
+
+    def testConstruction(self):
+        node = CompactNode('foo', [('bar', 'baz')])
+        self.assertEqual(node.name, 'foo')
+        self.assertEqual(node.attribute_pairs, (('bar', 'baz'),))
+        self.assertEqual(node.attributes, OrderedDict([('bar', 'baz')]))
+        self.assertEqual(list(node.children), [])
+        self.assertEqual(node.parent, None)
+        self.assertFalse(hasattr(node, '__dict__'))
+
+
+    def testSharedAttributes(self):
+        attributes = (('bar', 'baz'),)
+        self.assertTrue(CompactNode('foo', attributes).attribute_pairs is attributes)
+
+
+    def testAppendChild(self):
+        node = CompactNode('foo')
+        node.append_child(TextNode('bar'))
+        node.append_child(CompactNode('baz'))
+        self.assertEqual(node.children, [TextNode('bar'), CompactNode('baz')])
+
+
+    def testSetAttribute(self):
+        node = CompactNode('foo', [('a', '1'), ('b', '2')])
+        node.set_attribute('a', '3')
+        node.set_attribute('c', '4')
+        self.assertEqual(node.attribute_pairs, (('a', '3'), ('b', '2'), ('c', '4')))
+
+
+    def testEqualityWithNode(self):
+        node = Node('foo')
+        node.attributes['bar'] = 'baz'
+        node.children.append(Node('child'))
+        compact = CompactNode('foo', [('bar', 'baz')])
+        compact.append_child(CompactNode('child'))
+        self.assertEqual(compact, node)
+        self.assertEqual(node, compact)
+        
+        compact.append_child(TextNode('text'))
+        self.assertNotEqual(compact, node)
+
+
+    def testHash(self):
+        self.assertRaises(TypeError, lambda: hash(CompactNode('foo')))
+
+
+    def testToString(self):
+        node = CompactNode('foo', [('bar', 'baz')])
+        self.assertEqual(node.to_string(), '<foo bar="baz" />')
+        node.append_child(CompactNode('child'))
+        self.assertEqual(node.to_string(), '<foo bar="baz"><child /></foo>')
+
+
 class TestTextNode(unittest.TestCase):
 
     def testConstruction(self):
@@ -93,6 +174,12 @@ class TestTextNode(unittest.TestCase):
         self.assertEqual(node.to_string(), 'foo')
 
 
+    def testWrite(self):
+        out = StringIO()
+        TextNode('foo').write(out)
+        self.assertEqual(out.getvalue(), 'foo')
+
+
 class TestErrorNode(unittest.TestCase):
     
     def testErrorNode(self):
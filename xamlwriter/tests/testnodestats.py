@@ -0,0 +1,97 @@
+import unittest
+from StringIO import StringIO
+
+from docutils import nodes
+from docutils.core import publish_doctree
+
+from xamlwriter.events import XamlEmitter
+from xamlwriter.nodestats import NodeStats
+from xamlwriter.translator import XamlEventTranslator, XamlTranslator
+from xamlwriter.writer import publish_xaml, publish_xaml_timed
+
+from xamlwriter.tests.testxamlwriter import STREAMING_SOURCE, settings_overrides
+
+
+class TestNodeStats(unittest.TestCase):
+
+    def testCounts(self):
+        stats = NodeStats()
+        xaml, _ = publish_xaml_timed('Hello *world* and :sup:`super`',
+                                     flowdocument=False, node_stats=stats)
+        self.assertEqual(xaml, publish_xaml('Hello *world* and :sup:`super`',
+                                            flowdocument=False))
+        self.assertEqual(stats.nodes, {'document': 1, 'paragraph': 1,
+                                       'emphasis': 1, 'superscript': 1,
+                                       'Text': 4})
+        self.assertEqual(stats.dropped, {'superscript': 1})
+        self.assertEqual(stats.elements, {'StackPanel': 1, 'TextBlock': 1,
+                                          'Run': 1})
+        self.assertEqual(sorted(stats.visit_time), sorted(stats.nodes))
+        self.assertTrue(stats.time('paragraph') >= 0)
+    
+    
+    def testStreamingCountsTheSame(self):
+        for flowdocument in (True, False):
+            tree_stats = NodeStats()
+            stream_stats = NodeStats()
+            tree, _ = publish_xaml_timed(STREAMING_SOURCE,
+                                         flowdocument=flowdocument,
+                                         node_stats=tree_stats)
+            stream, _ = publish_xaml_timed(STREAMING_SOURCE,
+                                           flowdocument=flowdocument,
+                                           streaming=True,
+                                           node_stats=stream_stats)
+            self.assertEqual(tree, stream)
+            self.assertEqual(tree_stats.nodes, stream_stats.nodes)
+            self.assertEqual(tree_stats.elements, stream_stats.elements)
+    
+    
+    def testOnlyProfiledTranslator(self):
+        document = publish_doctree('Hello', settings_overrides=settings_overrides)
+        profiled = XamlEventTranslator(document, XamlEmitter(StringIO()))
+        profiled.enable_profiling(NodeStats())
+        plain = XamlTranslator(document)
+        self.assertTrue('dispatch_visit' in vars(profiled))
+        self.assertFalse('dispatch_visit' in vars(plain))
+        self.assertFalse('dispatch_departure' in vars(plain))
+    
+    
+    def testRaisingDepartureRecorded(self):
+        document = publish_doctree('Hello', settings_overrides=settings_overrides)
+        stats = NodeStats()
+        translator = XamlTranslator(document)
+        def depart_paragraph(self, node):
+            raise nodes.SkipSiblings
+        translator.departures = dict(translator.departures)
+        translator.departures[nodes.paragraph] = depart_paragraph
+        translator.enable_profiling(stats)
+        paragraph = document[0]
+        translator.dispatch_visit(paragraph)
+        self.assertRaises(nodes.SkipSiblings, translator.dispatch_departure,
+                          paragraph)
+        self.assertTrue('paragraph' in stats.depart_time)
+        
+        def depart_document(self, node):
+            raise nodes.StopTraversal
+        translator.departures[nodes.document] = depart_document
+        translator.enable_profiling(stats)
+        self.assertRaises(nodes.StopTraversal, translator.dispatch_departure,
+                          document)
+        self.assertEqual(stats.elements, {'FlowDocument': 1, 'Paragraph': 1})
+    
+    
+    def testReport(self):
+        stats = NodeStats()
+        stats.add_visit('paragraph', 0.5)
+        stats.add_departure('paragraph', 0.25)
+        stats.add_visit('table', 0.0, dropped=True)
+        stats.add_element('Paragraph')
+        lines = stats.report()
+        self.assertTrue(lines[1].startswith('paragraph'))
+        self.assertEqual(lines[-2], 'Dropped by unknown_visit: table (1)')
+        self.assertEqual(lines[-1], 'XAML elements: Paragraph (1)')
+
+
+
+if __name__ == '__main__':
+    unittest.main()
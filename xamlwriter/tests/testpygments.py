@@ -1,8 +1,10 @@
+import re
+import threading
 import unittest
 
 from textwrap import dedent
 
-from xamlwriter.writer import publish_xaml
+from xamlwriter.writer import publish_xaml, publish_xaml_ex
 
 # This installs the pygments directive
 import xamlwriter.register_directive
@@ -64,6 +66,38 @@ class TestPygments(unittest.TestCase):
             xamlwriter.register_directive.flowdocument = True
 
 
+    def testModeFollowsWriter(self):
+        # the directive uses the mode passed to publish_xaml rather than the
+        # module level default
+        source = make_source('x')
+        self.assertTrue(xamlwriter.register_directive.flowdocument)
+        output = publish_xaml(source, flowdocument=False)
+        self.assertTrue(output.startswith(make_doc_sl('')[:-len('</TextBlock></StackPanel>')]))
+
+
+    def testConcurrentModes(self):
+        source = make_source('"foo  foo"\n"foo  foo"')
+        expected = {
+            True: publish_xaml(source),
+            False: publish_xaml(source, flowdocument=False),
+        }
+        self.assertNotEqual(expected[True], expected[False])
+        
+        results = []
+        def convert(flowdocument):
+            for _ in range(10):
+                output = publish_xaml(source, flowdocument=flowdocument)
+                results.append(output == expected[flowdocument])
+        
+        threads = [threading.Thread(target=convert, args=(i % 2 == 0,))
+                   for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [True] * 60)
+
+
     def testStoreCodeBlocks(self):
         try:
             from xamlwriter import register_directive
@@ -73,10 +107,86 @@ class TestPygments(unittest.TestCase):
         finally:
             register_directive.store_code_blocks = False
             register_directive.code_blocks = []
-            
 
 
 
+class TestTokenStyleResources(unittest.TestCase):
+
+    source = make_source('def f(x):\n    # comment\n    return "x"')
+    
+    def testResources(self):
+        xaml = publish_xaml(self.source, style_resources=True)
+        resources_start = xaml.index('<FlowDocument.Resources>')
+        resources_end = xaml.index('</FlowDocument.Resources>')
+        self.assertEqual(xaml[:resources_start], make_doc('')[:resources_start])
+        resources = xaml[resources_start:resources_end]
+        code = xaml[resources_end:]
+        
+        self.assertTrue('x:Key="t_k"' in resources)
+        self.assertTrue('<Run Style="{StaticResource t_k}">def</Run>' in code)
+        self.assertFalse('FontWeight' in code)
+        # a single colour stays inline, and unstyled text has no Run
+        self.assertTrue('<Run Foreground="#0000FF">f</Run>' in code)
+        self.assertFalse('<Run>' in code)
+        # every Style that is referred to is defined, and only those
+        referred = set(re.findall(r'StaticResource (\w+)', code))
+        defined = set(re.findall(r'x:Key="(\w+)"', resources))
+        self.assertEqual(referred, defined)
+    
+    
+    def testSmaller(self):
+        source = '\n\n'.join([self.source] * 50)
+        self.assertTrue(len(publish_xaml(source, style_resources=True)) <
+                        len(publish_xaml(source)))
+    
+    
+    def testSameAsTree(self):
+        self.assertEqual(publish_xaml(self.source, style_resources=True,
+                                      streaming=True),
+                         publish_xaml(self.source, style_resources=True))
+    
+    
+    def testNoCodeBlocks(self):
+        self.assertEqual(publish_xaml('Hello', style_resources=True),
+                         publish_xaml('Hello'))
+    
+    
+    def testSilverlightRunsUnchanged(self):
+        xaml = publish_xaml(self.source, flowdocument=False,
+                            style_resources=True)
+        self.assertFalse('StaticResource' in xaml)
+        self.assertTrue('<Run Foreground=' in xaml)
+
+
+class TestPublishXamlEx(unittest.TestCase):
+
+    def testCodeBlocks(self):
+        source = ('.. code-block:: python\n\n    x = 1\n    y = 2\n\n'
+                  '.. code-block:: pycon\n\n    >>> x\n    1\n\n'
+                  '.. code-block:: ruby\n\n    puts 1\n')
+        xaml, code_blocks = publish_xaml_ex(source, flowdocument=False)
+        self.assertEqual(code_blocks, (u'x = 1\ny = 2', u'x'))
+        self.assertEqual(xamlwriter.register_directive.code_blocks, [])
+        try:
+            self.assertEqual(xaml, publish_xaml(source, flowdocument=False,
+                                                store_code_blocks=True))
+        finally:
+            xamlwriter.register_directive.code_blocks = []
+
+
+    def testPerCall(self):
+        first = publish_xaml_ex(make_source('x = 1'))[1]
+        second = publish_xaml_ex(make_source('y = 2'))[1]
+        self.assertEqual((first, second), ((u'x = 1',), (u'y = 2',)))
+
+
+    def testNotStored(self):
+        xaml, code_blocks = publish_xaml_ex(make_source('x = 1'),
+                                            store_code_blocks=False)
+        self.assertEqual(code_blocks, ())
+        self.assertEqual(xaml, publish_xaml(make_source('x = 1')))
+
+
 
 if __name__ == '__main__':
     unittest.main()
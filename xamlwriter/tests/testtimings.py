@@ -0,0 +1,67 @@
+import unittest
+from StringIO import StringIO
+
+from xamlwriter.timings import Timings
+from xamlwriter.writer import publish_xaml, publish_xaml_timed
+
+# This installs the pygments directive
+import xamlwriter.register_directive
+
+
+SOURCE = """\
+A paragraph.
+
+.. code-block:: python
+
+    x = 1
+    y = 2
+
+.. code-block:: nosuchlexer
+
+    text
+"""
+
+
+class TestTimings(unittest.TestCase):
+
+    def testPhases(self):
+        xaml, timings = publish_xaml_timed(SOURCE)
+        self.assertEqual(xaml, publish_xaml(SOURCE))
+        for phase in Timings.PHASES:
+            self.assertEqual(timings.calls(phase), 1)
+            self.assertTrue(timings.seconds(phase) >= 0)
+        self.assertTrue(timings.seconds('highlight') <= timings.seconds('parse'))
+        self.assertEqual(timings.calls('highlight'), 2)
+        self.assertEqual([block[:2] for block in timings.code_blocks],
+                         [('python', 2), ('nosuchlexer', 1)])
+    
+    
+    def testStreaming(self):
+        out = StringIO()
+        xaml, timings = publish_xaml_timed(SOURCE, flowdocument=False,
+                                           outfile=out, streaming=True)
+        self.assertEqual(xaml, None)
+        self.assertEqual(out.getvalue(), publish_xaml(SOURCE, flowdocument=False))
+        self.assertEqual(timings.calls('serialize'), 0)
+        self.assertEqual(timings.calls('translate'), 1)
+    
+    
+    def testReport(self):
+        timings = Timings()
+        timings.add('parse', 0.5)
+        timings.add_code_block('python', 10, 0.25)
+        timings.add('translate', 0.25)
+        self.assertEqual(timings.total, 0.75)
+        self.assertEqual(timings.report(), [
+            'parse              0.500s',
+            '  highlight        0.250s  (1 code blocks)',
+            'translate          0.250s',
+            'total              0.750s',
+            'Slowest code blocks:',
+            '      0.250s  python, 10 lines',
+        ])
+
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,29 @@
+import unittest
+
+from xamlwriter.utils import escape_xaml, escape_xaml_nbsp
+
+
+class TestEscape(unittest.TestCase):
+
+    def testEscape(self):
+        self.assertEqual(escape_xaml(u'a & b < c > d "e" \'f\' &amp;'),
+                         u'a &amp; b &lt; c &gt; d &quot;e&quot; &apos;f&apos; &amp;amp;')
+
+
+    def testNothingToEscape(self):
+        text = u'plain text with no special characters'
+        self.assertTrue(escape_xaml(text) is text)
+        self.assertEqual(escape_xaml(''), '')
+
+
+    def testEscapeNbsp(self):
+        self.assertEqual(escape_xaml_nbsp(u'  a < b'),
+                         u'&#160;&#160;a&#160;&lt;&#160;b')
+        self.assertEqual(escape_xaml_nbsp(u'a b', '&#0160;'), u'a&#0160;b')
+        self.assertEqual(escape_xaml_nbsp(u'&'), u'&amp;')
+        text = u'word'
+        self.assertTrue(escape_xaml_nbsp(text) is text)
+
+
+if __name__ == '__main__':
+    unittest.main()
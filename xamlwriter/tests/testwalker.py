@@ -0,0 +1,165 @@
+import unittest
+from StringIO import StringIO
+
+from docutils import nodes
+from docutils.core import publish_doctree
+from docutils.utils import new_document
+
+from xamlwriter.events import XamlEmitter
+from xamlwriter.translator import (TeeTranslator, XamlEventTranslator,
+                                   XamlTranslator)
+from xamlwriter.walker import iter_nodes, walkabout
+from xamlwriter.writer import get_doctree, publish_xaml, publish_xaml_both
+
+from xamlwriter.tests.testxamlwriter import STREAMING_SOURCE, settings_overrides
+
+
+class RecordingVisitor(nodes.NodeVisitor):
+    """Records the calls, and raises `exceptions` for the given nodes."""
+
+    def __init__(self, document, exceptions=None):
+        nodes.NodeVisitor.__init__(self, document)
+        self.calls = []
+        self.exceptions = exceptions or {}
+
+    def dispatch_visit(self, node):
+        self.calls.append(('visit', node))
+        exception = self.exceptions.get(('visit', node.astext()))
+        if exception is not None:
+            raise exception
+
+    def dispatch_departure(self, node):
+        self.calls.append(('depart', node))
+        exception = self.exceptions.get(('depart', node.astext()))
+        if exception is not None:
+            raise exception
+
+
+def nested_document(depth, container=nodes.block_quote):
+    document = new_document('<stress>')
+    parent = document
+    for _ in range(depth):
+        child = container()
+        parent += child
+        parent = child
+    parent += nodes.paragraph('', 'deep')
+    return document
+
+
+class TestWalker(unittest.TestCase):
+
+    def assertSameWalk(self, document, exceptions=None):
+        expected = RecordingVisitor(document, exceptions)
+        expected_stop = document.walkabout(expected)
+        actual = RecordingVisitor(document, exceptions)
+        actual_stop = walkabout(document, actual)
+        self.assertEqual(actual.calls, expected.calls)
+        self.assertEqual(actual_stop, expected_stop)
+
+
+    def testSameAsDocutils(self):
+        document = publish_doctree(STREAMING_SOURCE,
+                                   settings_overrides=settings_overrides)
+        self.assertSameWalk(document)
+
+
+    def testExceptions(self):
+        document = publish_doctree('one\n\n* two\n* three *four*\n* five\n\nsix',
+                                   settings_overrides=settings_overrides)
+        for exception in (nodes.SkipNode, nodes.SkipDeparture,
+                          nodes.SkipChildren, nodes.SkipSiblings,
+                          nodes.StopTraversal):
+            for text in ('two', 'three four', 'four'):
+                self.assertSameWalk(document, {('visit', text): exception})
+        self.assertSameWalk(document, {('depart', 'two'): nodes.SkipSiblings})
+
+
+    def testIterNodes(self):
+        document = publish_doctree(STREAMING_SOURCE,
+                                   settings_overrides=settings_overrides)
+        self.assertEqual(list(iter_nodes(document)), list(document.traverse()))
+        self.assertEqual(list(iter_nodes(document, nodes.paragraph)),
+                         list(document.traverse(nodes.paragraph)))
+
+
+    def testDeepNesting(self):
+        depth = 20000
+        for container in (nodes.block_quote, nodes.emphasis):
+            document = nested_document(depth, container)
+            for flowdocument in (True, False):
+                translator = XamlTranslator(document, flowdocument=flowdocument)
+                walkabout(document, translator)
+                xaml = translator.root.to_string()
+                self.assertTrue('deep' in xaml)
+
+                out = StringIO()
+                translator = XamlEventTranslator(document, XamlEmitter(out),
+                                                 flowdocument=flowdocument)
+                walkabout(document, translator)
+                self.assertEqual(out.getvalue(), xaml)
+
+
+
+class TestTeeTranslator(unittest.TestCase):
+
+    def testSameCallsAsAlone(self):
+        document = publish_doctree('one\n\n* two\n* three *four*\n* five\n\nsix',
+                                   settings_overrides=settings_overrides)
+        for exception in (nodes.SkipNode, nodes.SkipDeparture,
+                          nodes.SkipChildren):
+            for text in ('two', 'three four', 'four'):
+                exceptions = {('visit', text): exception}
+                alone = RecordingVisitor(document, exceptions)
+                walkabout(document, alone)
+                plain = RecordingVisitor(document)
+                skipping = RecordingVisitor(document, exceptions)
+                walkabout(document, TeeTranslator(document, [plain, skipping]))
+                self.assertEqual(skipping.calls, alone.calls)
+                self.assertEqual(len(plain.calls), 2 * len(list(iter_nodes(document))))
+
+
+    def testBothModes(self):
+        # This installs the pygments directive
+        import xamlwriter.register_directive
+        
+        code = STREAMING_SOURCE + '\n.. code-block:: python\n\n    x = 1\n'
+        # with INFO and ERROR system messages
+        messages = 'A\n=\n\nx\n\nB\n=\n\nA\n-\n\ny bad_\n'
+        overrides = {'warning_stream': False}
+        for source in (code, messages):
+            for style_resources in (False, True):
+                flowdocument, silverlight = publish_xaml_both(
+                    source, overrides=overrides,
+                    style_resources=style_resources)
+                self.assertEqual(flowdocument, publish_xaml(
+                    source, overrides=overrides,
+                    style_resources=style_resources))
+                self.assertEqual(silverlight, publish_xaml(
+                    source, flowdocument=False, overrides=overrides,
+                    style_resources=style_resources))
+
+
+    def testCodeLexedOnce(self):
+        import xamlwriter.register_directive
+        from xamlwriter import highlight
+        
+        document = get_doctree('.. code-block:: python\n\n    x = 1\n\n'
+                               '.. code-block:: python\n\n    y = 2\n')
+        translators = [XamlTranslator(document, flowdocument=flowdocument)
+                       for flowdocument in (True, False)]
+        tee = TeeTranslator(document, translators)
+        self.assertTrue(translators[0].code_tokens is translators[1].code_tokens)
+        
+        # without the cache of highlighted XAML every block is formatted
+        cache = highlight.highlight_cache
+        highlight.highlight_cache = None
+        try:
+            walkabout(document, tee)
+        finally:
+            highlight.highlight_cache = cache
+        self.assertEqual(sorted(translators[0].code_tokens),
+                         [('python', u'x = 1'), ('python', u'y = 2')])
+
+
+if __name__ == '__main__':
+    unittest.main()
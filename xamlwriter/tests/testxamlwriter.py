@@ -1,10 +1,12 @@
 import unittest
+from StringIO import StringIO
 from textwrap import dedent
-from docutils.core import publish_string
+from docutils import nodes
+from docutils.core import publish_doctree, publish_string
 
 from xamlwriter.node import Node, TextNode
-from xamlwriter.translator import FONT_SIZE, MARGIN, FONTS, MONOSPACE
-from xamlwriter.writer import XamlWriter, publish_xaml
+from xamlwriter.translator import FONT_SIZE, MARGIN, FONTS, MONOSPACE, XamlTranslator
+from xamlwriter.writer import XamlPublisher, XamlWriter, publish_xaml, publish_xaml_ex
 
 
 settings_overrides = {
@@ -166,6 +168,13 @@ class TestXamlWriter(unittest.TestCase):
         self.assertEqual(output, node.to_string())
         
     
+    def testPublishToFile(self):
+        data = 'Hello *world*'
+        out = StringIO()
+        self.assertEqual(publish_xaml(data, outfile=out), None)
+        self.assertEqual(out.getvalue(), publish_xaml(data))
+
+    
     def testLiteralBlock(self):
         node = get_root()
         literal = Node('Paragraph')
@@ -492,6 +501,223 @@ class TestSilverlightXaml(unittest.TestCase):
 
 
 
+class TestDispatchTable(unittest.TestCase):
+
+    def testTableSharedPerMode(self):
+        document = publish_doctree('Hello', settings_overrides=settings_overrides)
+        flowdocument = XamlTranslator(document)
+        silverlight = XamlTranslator(document, flowdocument=False)
+        self.assertTrue(flowdocument.visitors is 
+                        XamlTranslator(document).visitors)
+        self.assertTrue(flowdocument.visitors is not silverlight.visitors)
+
+
+    def testUnknownNodeClass(self):
+        class custom_node(nodes.Element):
+            pass
+        
+        document = publish_doctree('Hello', settings_overrides=settings_overrides)
+        document[0].append(custom_node('', nodes.Text(' world')))
+        visitor = XamlTranslator(document)
+        document.walkabout(visitor)
+        
+        node = get_root()
+        para = Node('Paragraph')
+        para.children.append(TextNode('Hello'))
+        para.children.append(TextNode(' world'))
+        node.children.append(para)
+        self.assertEqual(visitor.root, node)
+        self.assertTrue(custom_node in visitor.visitors)
+        self.assertTrue(custom_node in visitor.departures)
+
+STREAMING_SOURCE = """\
+=======
+ Title
+=======
+
+A paragraph with *italic*, **bold**, ``a  literal`` and :sup:`super`.
+
+| A line block
+| with two lines
+
+    A block quote.
+
+* A bullet list
+
+  #. with a nested
+  #. enumerated list
+
+     | and a nested
+     | line block
+
+* The second item
+
+::
+
+    A literal
+    block  here
+
+.. raw:: xaml
+
+   <Raw />
+"""
+
+
+class TestEventTranslator(unittest.TestCase):
+
+    def testEvents(self):
+        from xamlwriter.events import EventBuffer
+        from xamlwriter.translator import XamlEventTranslator
+        
+        document = publish_doctree('Hello *world*',
+                                   settings_overrides=settings_overrides)
+        handler = EventBuffer()
+        document.walkabout(XamlEventTranslator(document, handler))
+        
+        root = get_root()
+        self.assertEqual(handler.events, [
+            ('start_element', ('FlowDocument', tuple(root.attributes.items()))),
+            ('start_element', ('Paragraph', ())),
+            ('text', ('Hello ',)),
+            ('start_element', ('Italic', ())),
+            ('text', ('world',)),
+            ('end_element', ('Italic',)),
+            ('end_element', ('Paragraph',)),
+            ('end_element', ('FlowDocument',)),
+        ])
+    
+    
+    def testSameAsTree(self):
+        self.assertEqual(publish_xaml(STREAMING_SOURCE, streaming=True),
+                         publish_xaml(STREAMING_SOURCE))
+    
+    
+    def testSameAsTreeSilverlight(self):
+        self.assertEqual(publish_xaml(STREAMING_SOURCE, flowdocument=False,
+                                      streaming=True),
+                         publish_xaml(STREAMING_SOURCE, flowdocument=False))
+    
+    
+    def testStreamToFile(self):
+        out = StringIO()
+        self.assertEqual(publish_xaml(STREAMING_SOURCE, outfile=out,
+                                      streaming=True), None)
+        self.assertEqual(out.getvalue(), publish_xaml(STREAMING_SOURCE))
+
+
+
+class TestStyleResources(unittest.TestCase):
+
+    def testResourcesFirst(self):
+        xaml = publish_xaml(STREAMING_SOURCE, flowdocument=False,
+                            style_resources=True)
+        start = xaml.index('>') + 1
+        self.assertTrue(xaml[start:].startswith(
+            '<StackPanel.Resources><Style '))
+        self.assertTrue('x:Key="Paragraph"' in xaml)
+        self.assertTrue('Style="{StaticResource Title}"' in xaml)
+        self.assertTrue('Style="{StaticResource LiteralBlock}"' in xaml)
+        
+        # the fonts are only in the resources
+        resources_end = xaml.index('</StackPanel.Resources>')
+        self.assertFalse(FONTS in xaml[resources_end:])
+        self.assertFalse(MONOSPACE in xaml[resources_end:].replace(
+            'Run FontFamily="%s"' % MONOSPACE, ''))
+    
+    
+    def testSmaller(self):
+        source = '\n\n'.join(['A paragraph.'] * 20)
+        self.assertTrue(len(publish_xaml(source, flowdocument=False,
+                                         style_resources=True)) <
+                        len(publish_xaml(source, flowdocument=False)))
+    
+    
+    def testStyledAttributes(self):
+        document = publish_doctree('Hello',
+                                   settings_overrides=settings_overrides)
+        visitor = XamlTranslator(document, flowdocument=False,
+                                 style_resources=True)
+        attributes = visitor.styled('Paragraph', {'Margin': '0,10,0,0',
+                                                  'FontSize': '20',
+                                                  'FontFamily': FONTS})
+        self.assertEqual(attributes, {'FontSize': '20',
+                                      'Style': '{StaticResource Paragraph}'})
+    
+    
+    def testSameAsTree(self):
+        self.assertEqual(publish_xaml(STREAMING_SOURCE, flowdocument=False,
+                                      streaming=True, style_resources=True),
+                         publish_xaml(STREAMING_SOURCE, flowdocument=False,
+                                      style_resources=True))
+    
+    
+    def testNoEffectOnFlowDocument(self):
+        self.assertEqual(publish_xaml(STREAMING_SOURCE, style_resources=True),
+                         publish_xaml(STREAMING_SOURCE))
+
+
+
+class TestXamlPublisher(unittest.TestCase):
+
+    sources = [STREAMING_SOURCE, 'Hello *world*', '.. _target:\n\nTarget',
+               '.. _target:\n\nTarget again']
+
+    def testSameAsPublishXaml(self):
+        for flowdocument in (True, False):
+            for streaming in (False, True):
+                publisher = XamlPublisher(flowdocument=flowdocument,
+                                          streaming=streaming)
+                for source in self.sources * 2:
+                    self.assertEqual(publisher.publish(source),
+                                     publish_xaml(source,
+                                                  flowdocument=flowdocument))
+    
+    
+    def testOutfile(self):
+        for streaming in (False, True):
+            out = StringIO()
+            publisher = XamlPublisher(streaming=streaming)
+            self.assertEqual(publisher.publish(STREAMING_SOURCE, outfile=out),
+                             None)
+            self.assertEqual(out.getvalue(), publish_xaml(STREAMING_SOURCE))
+    
+    
+    def testSettingsNotShared(self):
+        publisher = XamlPublisher(overrides={'report_level': 5})
+        publisher.publish('Hello')
+        self.assertEqual(publisher.writer.document, None)
+        self.assertFalse(hasattr(publisher.settings, 'xaml_code_blocks'))
+        self.assertEqual(publisher.settings.report_level, 5)
+    
+    
+    def testCodeBlocks(self):
+        # This installs the pygments directive
+        import xamlwriter.register_directive
+        
+        source = '.. code-block:: python\n\n    x = %d\n'
+        publisher = XamlPublisher(flowdocument=False, store_code_blocks=True)
+        for number in range(3):
+            xaml, code_blocks = publisher.publish_ex(source % number)
+            self.assertEqual(code_blocks, (u'x = %d' % number,))
+            self.assertEqual(xaml, publish_xaml_ex(source % number,
+                                                   flowdocument=False)[0])
+    
+    
+    def testPublishExSameAsPublishXamlEx(self):
+        import xamlwriter.register_directive
+        
+        source = 'Text\n\n.. code-block:: python\n\n    x=1\n'
+        for store_code_blocks in (True, False):
+            publisher = XamlPublisher()
+            self.assertEqual(
+                publisher.publish_ex(source,
+                                     store_code_blocks=store_code_blocks),
+                publish_xaml_ex(source, store_code_blocks=store_code_blocks))
+        self.assertEqual(XamlPublisher().publish_ex(source)[1], (u'x=1',))
+        # the publisher's own settings aren't changed
+        self.assertEqual(XamlPublisher().publish(source), publish_xaml(source))
+
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,90 @@
+"""
+Wall clock timings for the phases of a conversion, collected by
+`xamlwriter.writer.publish_xaml_timed`.
+"""
+
+import time
+
+__all__ = ['Timings']
+
+
+class Timings(object):
+    """
+    The time spent in, and the number of calls to, each phase of a
+    conversion, plus the time taken to highlight each code block.
+
+    The phases are, in order, 'settings' (setting up docutils), 'parse',
+    'transforms', 'translate' and 'serialize'. Code blocks are highlighted
+    while the document is parsed, so 'highlight' is part of 'parse'. When
+    the XAML is streamed it is written out as the tree is translated, and
+    there is no 'serialize' phase.
+
+    `code_blocks` is a list of (language, lines, seconds) tuples, one per
+    code block, in document order.
+    """
+
+    PHASES = ('settings', 'parse', 'transforms', 'translate', 'serialize')
+
+    def __init__(self):
+        # phase name -> [seconds, calls]
+        self.phases = {}
+        self.code_blocks = []
+
+
+    def add(self, phase, seconds):
+        entry = self.phases.setdefault(phase, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+    def add_code_block(self, language, lines, seconds):
+        self.code_blocks.append((language, lines, seconds))
+        self.add('highlight', seconds)
+
+
+    def time(self, phase, function, *args, **keywords):
+        """Call `function` and add the time it takes to `phase`."""
+        start = time.time()
+        try:
+            return function(*args, **keywords)
+        finally:
+            self.add(phase, time.time() - start)
+
+
+    def seconds(self, phase):
+        return self.phases.get(phase, (0.0, 0))[0]
+
+
+    def calls(self, phase):
+        return self.phases.get(phase, (0.0, 0))[1]
+
+
+    @property
+    def total(self):
+        return sum(self.seconds(phase) for phase in self.PHASES)
+
+
+    def report(self, slowest=5):
+        """
+        Return a breakdown of the timings as a list of lines, including the
+        `slowest` slowest code blocks.
+        """
+        lines = []
+        for phase in self.PHASES:
+            if phase not in self.phases:
+                continue
+            lines.append('%-14s %9.3fs' % (phase, self.seconds(phase)))
+            if phase == 'parse' and self.code_blocks:
+                lines.append('  %-12s %9.3fs  (%d code blocks)' % (
+                    'highlight', self.seconds('highlight'),
+                    len(self.code_blocks)))
+        lines.append('%-14s %9.3fs' % ('total', self.total))
+
+        blocks = sorted(self.code_blocks, key=lambda block: block[2],
+                        reverse=True)[:slowest]
+        if blocks:
+            lines.append('Slowest code blocks:')
+            for language, count, seconds in blocks:
+                lines.append('  %9.3fs  %s, %d lines' % (seconds, language,
+                                                         count))
+        return lines
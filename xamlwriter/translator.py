@@ -1,11 +1,17 @@
 import copy
 import re
+import time
 
 from docutils import nodes
-from docutils.nodes import NodeVisitor, SkipNode
+from docutils.nodes import NodeVisitor, SkipChildren, SkipDeparture, SkipNode
 
-from xamlwriter.node import ErrorNode, Node, TextNode
-from xamlwriter.utils import escape_xaml
+from xamlwriter.events import EventBuffer
+from xamlwriter.highlight import code_block, highlight_code
+from xamlwriter.node import CompactNode, ErrorNode, TextNode
+from xamlwriter.nodestats import ElementCounter
+from xamlwriter.utils import escape_xaml, escape_xaml_nbsp
+from xamlwriter.walker import iter_nodes
+from xamlwriter.xamlformatter import XamlFormatter
 
 
 FONT_SIZE = '15'
@@ -13,20 +19,61 @@ MARGIN = "16,0,0,0"
 FONTS = 'Verdana,Tahoma,Geneva,Lucida Grande,Trebuchet MS,Helvetica,Arial,Serif'
 MONOSPACE = "Consolas, Monaco, Lucida Console, Global Monospace"
 
+# Named styles for the Silverlight elements that all repeat the same
+# attributes. With style resources they are written once, as Styles in the
+# resources of the root StackPanel, and the elements refer to them.
+SILVERLIGHT_STYLES = (
+    ('Paragraph', 'TextBlock', (('Margin', '0,10,0,0'), ('FontSize', FONT_SIZE),
+                                ('TextWrapping', 'Wrap'), ('FontFamily', FONTS))),
+    ('FirstParagraph', 'TextBlock', (('FontSize', FONT_SIZE),
+                                     ('TextWrapping', 'Wrap'),
+                                     ('FontFamily', FONTS))),
+    ('Title', 'TextBlock', (('Margin', '0,10,0,0'), ('FontFamily', FONTS))),
+    ('ListPoint', 'TextBlock', (('FontFamily', FONTS),)),
+    ('LiteralBlock', 'TextBlock', (('Margin', '15,10,0,0'), ('FontSize', '15'),
+                                   ('TextWrapping', 'Wrap'),
+                                   ('FontFamily', MONOSPACE))),
+)
+
+_style_setters = dict((key, setters) for key, _, setters in SILVERLIGHT_STYLES)
+
+def _visit_text(self, node):
+    self.add_text(node.astext())
+    raise SkipNode
+
+
+def _depart_trivial(self, node):
+    self.end_node()
+
+
 class XamlTranslator(NodeVisitor):
 
-    def __init__(self, document, flowdocument=True, xclass=True):
+    # the class used for the nodes of the XAML tree
+    node_class = CompactNode
+    
+    # a dictionary for the lexed tokens of deferred code blocks, shared with
+    # translators writing the same document in another mode (see
+    # `TeeTranslator`)
+    code_tokens = None
+
+    def __init__(self, document, flowdocument=True, xclass=True,
+                 style_resources=False):
         NodeVisitor.__init__(self, document)
         self.flowdocument = flowdocument
+        self.style_resources = style_resources
+        # identical attribute tuples are shared between nodes
+        self.shared_attributes = {}
         if flowdocument:
-            self.root = Node('FlowDocument')
-            self.root.attributes['FontSize'] = FONT_SIZE
+            name = 'FlowDocument'
+            attributes = [('FontSize', FONT_SIZE)]
         else:
-            self.root = Node('StackPanel')
+            name = 'StackPanel'
+            attributes = []
             if xclass:
-                self.root.attributes['x:Class'] = 'System.Windows.Controls.StackPanel'
-        self.root.attributes['xmlns'] = "http://schemas.microsoft.com/winfx/2006/xaml/presentation"
-        self.root.attributes['xmlns:x'] = "http://schemas.microsoft.com/winfx/2006/xaml"
+                attributes.append(('x:Class', 'System.Windows.Controls.StackPanel'))
+        attributes.append(('xmlns', "http://schemas.microsoft.com/winfx/2006/xaml/presentation"))
+        attributes.append(('xmlns:x', "http://schemas.microsoft.com/winfx/2006/xaml"))
+        self.root = self.node_class(name, attributes)
         self.curnode = self.root
         self.context = []
         self.initial_header_level = 2
@@ -35,17 +82,19 @@ class XamlTranslator(NodeVisitor):
         self.list_item = 0
         self.done_first_item = True
         self.bullet_list = True
+        self.visitors, self.departures = self.get_dispatch_tables()
 
-    def begin_node(self, node, tagname, **more_attributes):
-        new_node = Node(tagname)
-        attributes = new_node.attributes
-        for name, value in more_attributes.iteritems():
-            attributes[name] = value
+    def begin_node(self, node, tagname, style=None, **more_attributes):
+        if style is not None:
+            more_attributes = self.styled(style, more_attributes)
+        attributes = tuple(more_attributes.iteritems())
+        attributes = self.shared_attributes.setdefault(attributes, attributes)
+        new_node = self.node_class(tagname, attributes)
         if node is not None:
             # ids and classes handled here
             pass
         new_node.parent = self.curnode
-        self.curnode.children.append(new_node)
+        self.curnode.append_child(new_node)
         self.curnode = new_node
 
     def end_node(self):
@@ -54,24 +103,75 @@ class XamlTranslator(NodeVisitor):
     def add_text(self, text, escape=True):
         if not text:
             return
-        if escape:
-            text = escape_xaml(text)
         if not self.in_literal:
-            self.curnode.children.append(TextNode(text))
+            if escape:
+                text = escape_xaml(text)
+            self.add_data(text)
             return
         assert not self.flowdocument
-        text = text.replace(' ', '&#160;')
+        if escape:
+            text = escape_xaml_nbsp(text)
+        else:
+            text = text.replace(' ', '&#160;')
         parts = text.split('\n')
         for part in parts[:-1]:
-            self.curnode.children.append(TextNode(part))
-            self.curnode.children.append(Node('LineBreak'))
-        self.curnode.children.append(TextNode(parts[-1]))
+            self.add_data(part)
+            self.add_node('LineBreak')
+        self.add_data(parts[-1])
+
+    def add_data(self, data):
+        # data is XAML that has already been escaped
+        self.curnode.append_child(TextNode(data))
 
     def add_node(self, name, text='', escape=True, **attributes):
         self.begin_node(None, name, **attributes)
         self.add_text(text, escape=escape)
         self.end_node()
 
+    def styled(self, style, attributes):
+        """
+        Return `attributes` for an element with one of the Silverlight
+        styles. With style resources the attributes set by the style are
+        replaced by a reference to it.
+        """
+        if not self.style_resources:
+            return attributes
+        for name, value in _style_setters[style]:
+            if attributes.get(name) == value:
+                del attributes[name]
+        attributes['Style'] = '{StaticResource %s}' % style
+        return attributes
+
+    def add_style_resources(self, resources):
+        """
+        Add a resources element to the root for `resources`, a sequence of
+        (key, target type, setters) tuples.
+        """
+        self.begin_node(None, self.root.name + '.Resources')
+        for key, target_type, setters in resources:
+            self.begin_node(None, 'Style', **{'x:Key': key,
+                                              'TargetType': target_type})
+            for name, value in setters:
+                self.add_node('Setter', Property=name, Value=value)
+            self.end_node()
+        self.end_node()
+
+    def get_token_styles(self):
+        """
+        Return the Styles for the pygments token types used by the code
+        blocks in the document, as (key, target type, setters) tuples.
+        """
+        fragments = []
+        for node in iter_nodes(self.document):
+            if isinstance(node, nodes.raw):
+                if 'xaml' in node.get('format', '').split():
+                    fragments.append(node.astext())
+            elif isinstance(node, code_block):
+                fragments.append(self.highlight(node))
+        formatter = XamlFormatter(style_resources=True)
+        return [(key, 'Run', setters)
+                for key, setters in formatter.get_style_resources(fragments)]
+
     def unknown_visit(self, node):
         # should raise here or indicate unsupported feature some way
         return
@@ -106,41 +206,150 @@ class XamlTranslator(NodeVisitor):
         if self.flowdocument:
             return self.trivial_nodes_flowdocument
         return self.trivial_nodes_silverlight
+    
+    # dispatch tables keyed by (translator class, flowdocument)
+    dispatch_tables = {}
+    
+    def get_dispatch_tables(self):
+        """
+        Return the visit and depart dispatch tables for this translator class
+        and mode, building them the first time they are needed.
         
-
-    def dispatch_visit(self, node):
-        # don't call visitor methods for trivial nodes
-        node_name = node.__class__.__name__
+        The tables map docutils node classes to the functions that handle
+        them. The functions are called with the translator and the node.
+        """
+        key = (self.__class__, self.flowdocument)
+        tables = self.dispatch_tables.get(key)
+        if tables is None:
+            tables = {}, {}
+            for node_name in nodes.node_class_names + ['Text']:
+                self.add_dispatch(getattr(nodes, node_name), tables)
+            self.dispatch_tables[key] = tables
+        return tables
+    
+    def add_dispatch(self, node_class, tables=None):
+        """
+        Add the visit and depart functions for a docutils node class to the
+        dispatch tables and return them.
+        """
+        if tables is None:
+            tables = self.visitors, self.departures
+        node_name = node_class.__name__
+        cls = self.__class__
         if node_name == 'Text':
-            self.add_text(node.astext())
-            raise SkipNode
-            
-        tagname, atts = self.trivial_nodes.get(node_name, (None, None))
-        if tagname:
-            self.begin_node(node, tagname, **atts)
+            visit, depart = _visit_text, cls.unknown_departure.im_func
         else:
-            getattr(self, 'visit_' + node_name, self.unknown_visit)(node)
+            # don't call visitor methods for trivial nodes
+            tagname, atts = self.trivial_nodes.get(node_name, (None, None))
+            if tagname:
+                def visit(self, node):
+                    self.begin_node(node, tagname, **atts)
+                depart = _depart_trivial
+            else:
+                visit = getattr(cls, 'visit_' + node_name, cls.unknown_visit).im_func
+                depart = getattr(cls, 'depart_' + node_name, cls.unknown_departure).im_func
+        tables[0][node_class] = visit
+        tables[1][node_class] = depart
+        return visit, depart
+
+    def dispatch_visit(self, node):
+        try:
+            visit = self.visitors[node.__class__]
+        except KeyError:
+            # node classes that aren't in docutils.nodes
+            visit = self.add_dispatch(node.__class__)[0]
+        visit(self, node)
 
     def dispatch_departure(self, node):
-        node_name = node.__class__.__name__
+        try:
+            depart = self.departures[node.__class__]
+        except KeyError:
+            depart = self.add_dispatch(node.__class__)[1]
+        depart(self, node)
+
+    def visit_document(self, node):
+        if not self.style_resources:
+            return
+        if not self.flowdocument:
+            self.add_style_resources(SILVERLIGHT_STYLES)
+            return
+        resources = self.get_token_styles()
+        if resources:
+            self.add_style_resources(resources)
+
+    def enable_profiling(self, stats):
+        """
+        Count and time the visit and depart handlers for each docutils node
+        class, and count the XAML elements, in `stats` (a
+        `xamlwriter.nodestats.NodeStats`).
         
-        tagname, atts = self.trivial_nodes.get(node_name, (None, None))
-        if tagname:
-            self.end_node()
-        else:
-            getattr(self, 'depart_' + node_name, self.unknown_departure)(node)
+        Only the dispatch methods of this translator are replaced, so
+        translators without profiling don't pay for it.
+        """
+        visitors, departures = self.visitors, self.departures
+        add_dispatch = self.add_dispatch
+        unknown_visit = self.__class__.unknown_visit.im_func
+        timer = time.time
+        translator = self
+        
+        def dispatch_visit(node):
+            node_class = node.__class__
+            try:
+                visit = visitors[node_class]
+            except KeyError:
+                visit = add_dispatch(node_class)[0]
+            start = timer()
+            try:
+                visit(translator, node)
+            finally:
+                stats.add_visit(node_class.__name__, timer() - start,
+                                visit is unknown_visit)
+        
+        def dispatch_departure(node):
+            node_class = node.__class__
+            try:
+                depart = departures[node_class]
+            except KeyError:
+                depart = add_dispatch(node_class)[1]
+            start = timer()
+            try:
+                depart(translator, node)
+            finally:
+                stats.add_departure(node_class.__name__, timer() - start)
+                if node is translator.document:
+                    translator.count_elements(stats)
+        
+        self.dispatch_visit = dispatch_visit
+        self.dispatch_departure = dispatch_departure
+
+    def count_elements(self, stats):
+        stats.count_elements(self.root)
 
     def visit_raw(self, node):
         if 'xaml' in node.get('format', '').split():
-            self.curnode.children.append(TextNode(node.astext()))
+            self.add_data(node.astext())
+        raise SkipNode
+    
+    def highlight(self, node):
+        """Return the highlighted XAML for a deferred `code_block`."""
+        return highlight_code(node['language'], node.astext(),
+                              flowdocument=self.flowdocument,
+                              store_code_blocks=node['store_code_blocks'],
+                              style_resources=self.style_resources,
+                              tokens=self.code_tokens)
+    
+    def visit_code_block(self, node):
+        self.add_data(self.highlight(node))
         raise SkipNode
     
     def visit_paragraph(self, node):
         # Silverlight only
         attrs = {'FontSize': FONT_SIZE, 'TextWrapping': "Wrap", 'FontFamily': FONTS}
+        style = 'FirstParagraph'
         if self.done_first_item:
             attrs['Margin'] = "0,10,0,0"
-        self.begin_node(node, 'TextBlock', **attrs)
+            style = 'Paragraph'
+        self.begin_node(node, 'TextBlock', **self.styled(style, attrs))
         self.done_first_item = True
         
     def depart_paragraph(self, node):
@@ -148,10 +357,10 @@ class XamlTranslator(NodeVisitor):
     
     def visit_line_block(self, node):
         # Silverlight only
-        self.begin_node(node, 'TextBlock', Margin= "0,10,0,0", FontSize=FONT_SIZE, TextWrapping="Wrap", FontFamily=FONTS)
+        self.begin_node(node, 'TextBlock', style='Paragraph', Margin= "0,10,0,0", FontSize=FONT_SIZE, TextWrapping="Wrap", FontFamily=FONTS)
         
     def depart_line_block(self, node):
-        if self.curnode.children[-1] == Node('LineBreak'):
+        if self.curnode.children[-1] == self.node_class('LineBreak'):
             self.curnode.children.pop()
 
         self.end_node()
@@ -170,6 +379,7 @@ class XamlTranslator(NodeVisitor):
             node_type = 'TextBlock'
             attrs['Margin'] = '0,10,0,0'
             attrs['FontFamily'] = FONTS
+            attrs = self.styled('Title', attrs)
         if isinstance(node.parent, nodes.document):
             begun = True
             self.begin_node(node, node_type, FontSize='20', FontWeight='Bold', **attrs)
@@ -206,6 +416,7 @@ class XamlTranslator(NodeVisitor):
                 node_type = 'TextBlock'
                 attrs['Margin'] = '0,10,0,0'
                 attrs['FontFamily'] = FONTS
+                attrs = self.styled('Title', attrs)
             self.begin_node(node, node_type, FontSize='19',
                             FontStyle='Italic', **attrs)
             begun = True
@@ -221,8 +432,8 @@ class XamlTranslator(NodeVisitor):
     def visit_literal_block(self, node):
         # only used for Silverlight
         self.in_literal = True
-        self.begin_node(node, 'TextBlock', Margin="15,10,0,0", FontSize="15",
-                        TextWrapping="Wrap", FontFamily=MONOSPACE)
+        self.begin_node(node, 'TextBlock', style='LiteralBlock', Margin="15,10,0,0",
+                        FontSize="15", TextWrapping="Wrap", FontFamily=MONOSPACE)
         
     def depart_literal_block(self, node):
         self.in_literal = False
@@ -246,8 +457,9 @@ class XamlTranslator(NodeVisitor):
         self.end_node()
 
     def depart_bullet_list(self, node): 
-        rows = Node('Grid.RowDefinitions')
-        rows.children = [Node('RowDefinition') for _ in range(self.list_item)]
+        rows = self.node_class('Grid.RowDefinitions')
+        for _ in range(self.list_item):
+            rows.append_child(self.node_class('RowDefinition'))
         self.curnode.children.insert(1, rows)
         self.end_node()
         self.bullet_list = True
@@ -258,8 +470,9 @@ class XamlTranslator(NodeVisitor):
         point = '&#8226;'
         if not self.bullet_list:
             point = str(self.list_item + 1) + '.'
-        self.add_node('TextBlock', point, escape=False, 
-                      **{'Grid.Column': '0', 'Grid.Row': str(self.list_item), 'FontFamily': FONTS})
+        attrs = {'Grid.Column': '0', 'Grid.Row': str(self.list_item), 'FontFamily': FONTS}
+        self.add_node('TextBlock', point, escape=False,
+                      **self.styled('ListPoint', attrs))
         self.begin_node(node, 'StackPanel', Margin="5,0,0,5",
                       **{'Grid.Column': '1', 'Grid.Row': str(self.list_item)})
         self.list_item += 1
@@ -278,7 +491,153 @@ class XamlTranslator(NodeVisitor):
         self.end_node()
 
 
+class XamlEventTranslator(XamlTranslator):
+    """
+    A translator that reports the XAML it generates to `handler` as start
+    element, text and end element events (see `xamlwriter.events`) while
+    the doctree is walked, instead of building a node tree.
+
+    Output is only held back where the translator needs to look back: the
+    items of a Silverlight list are buffered until the number of
+    ``RowDefinition`` elements is known, and the last ``LineBreak`` of a
+    line is held until we know it doesn't end a line block.
+    """
+
+    def __init__(self, document, handler, flowdocument=True, xclass=True,
+                 style_resources=False):
+        XamlTranslator.__init__(self, document, flowdocument=flowdocument,
+                                xclass=xclass, style_resources=style_resources)
+        self.handler = handler
+        self.handlers = []
+        self.open_elements = []
+        self.pending_line_break = False
+        self.open_elements.append(self.root.name)
+        handler.start_element(self.root.name, self.root.attribute_items())
+
+    def enable_profiling(self, stats):
+        XamlTranslator.enable_profiling(self, stats)
+        # the elements are counted as they are written
+        stats.add_element(self.root.name)
+        self.handler = ElementCounter(self.handler, stats)
+
+    def count_elements(self, stats):
+        pass
+
+    def flush_line_break(self):
+        if self.pending_line_break:
+            self.pending_line_break = False
+            self.handler.start_element('LineBreak', ())
+            self.handler.end_element('LineBreak')
+
+    def begin_node(self, node, tagname, style=None, **more_attributes):
+        if style is not None:
+            more_attributes = self.styled(style, more_attributes)
+        self.flush_line_break()
+        self.open_elements.append(tagname)
+        self.handler.start_element(tagname, tuple(more_attributes.iteritems()))
+
+    def end_node(self):
+        self.flush_line_break()
+        self.handler.end_element(self.open_elements.pop())
+
+    def add_data(self, data):
+        self.flush_line_break()
+        self.handler.text(data)
+
+    def depart_document(self, node):
+        self.end_node()
+
+    def depart_line(self, node):
+        self.flush_line_break()
+        self.pending_line_break = True
+
+    def depart_line_block(self, node):
+        # a trailing LineBreak is dropped
+        self.pending_line_break = False
+        self.end_node()
+
+    def visit_bullet_list(self, node):
+        XamlTranslator.visit_bullet_list(self, node)
+        # the row definitions go before the list items, so the items are
+        # buffered until we know how many rows there are
+        self.handlers.append(self.handler)
+        self.handler = EventBuffer()
+
+    def depart_bullet_list(self, node):
+        self.flush_line_break()
+        items = self.handler
+        self.handler = self.handlers.pop()
+        self.begin_node(None, 'Grid.RowDefinitions')
+        for _ in range(self.list_item):
+            self.add_node('RowDefinition')
+        self.end_node()
+        items.replay(self.handler)
+        self.end_node()
+        self.bullet_list = True
+
+
 
 """
 Can use Floater for sidebar (FlowDocument).
-"""
\ No newline at end of file
+"""
+
+
+class TeeTranslator(NodeVisitor):
+    """
+    Drives several translators from one walk of a doctree, e.g. one for
+    FlowDocument and one for Silverlight, which share the lexed tokens of
+    the deferred code blocks.
+
+    Each translator sees the calls it would see if it walked the doctree
+    alone: when one of them skips a node (with `SkipNode`, `SkipChildren`
+    or `SkipDeparture`) the others still get it. The walk only skips a node
+    when every translator does.
+    """
+
+    def __init__(self, document, translators):
+        NodeVisitor.__init__(self, document)
+        self.translators = translators
+        tokens = {}
+        for translator in translators:
+            translator.code_tokens = tokens
+        # for each translator, None or the node it is skipping the children
+        # of, and whether it wants the departure for that node
+        self.skipping = [None] * len(translators)
+        # for each translator, the nodes it doesn't want the departure for
+        self.no_departures = [set() for _ in translators]
+
+    def dispatch_visit(self, node):
+        skipped = 0
+        for index, translator in enumerate(self.translators):
+            if self.skipping[index] is not None:
+                skipped += 1
+                continue
+            try:
+                translator.dispatch_visit(node)
+            except SkipNode:
+                self.skipping[index] = (node, False)
+                skipped += 1
+            except SkipChildren:
+                self.skipping[index] = (node, True)
+            except SkipDeparture:
+                self.no_departures[index].add(id(node))
+        if skipped == len(self.translators):
+            # nobody wants the children or the departure
+            for index, skipping in enumerate(self.skipping):
+                if skipping is not None and skipping[0] is node:
+                    self.skipping[index] = None
+            raise SkipNode
+
+    def dispatch_departure(self, node):
+        for index, translator in enumerate(self.translators):
+            skipping = self.skipping[index]
+            if skipping is not None:
+                if skipping[0] is not node:
+                    continue
+                self.skipping[index] = None
+                if not skipping[1]:
+                    continue
+            elif id(node) in self.no_departures[index]:
+                self.no_departures[index].remove(id(node))
+                continue
+            translator.dispatch_departure(node)
@@ -1,11 +1,32 @@
-
 # Using XAML escape rules (XML) from:
 # http://msdn.microsoft.com/en-us/library/ms748250.aspx
 
+import re
+
+__all__ = ['escape_xaml', 'escape_xaml_nbsp']
+
+# a single scan finds out whether there is anything to do at all - most text
+# and most pygments tokens have none of these
+_needs_escape = re.compile(u'[&<>"\']').search
+_needs_escape_or_nbsp = re.compile(u'[&<>"\' ]').search
+
+
 def escape_xaml(text):
     """Escape &, <, > as well as single and double quotes for XML."""
+    if _needs_escape(text) is None:
+        return text
     return text.replace('&', '&amp;').  \
                 replace('<', '&lt;').   \
                 replace('>', '&gt;').   \
                 replace('"', '&quot;'). \
                 replace("'", '&apos;')
+
+
+def escape_xaml_nbsp(text, nbsp='&#160;'):
+    """
+    Escape like `escape_xaml` and replace spaces with `nbsp`, for Silverlight
+    text where whitespace has to be preserved.
+    """
+    if _needs_escape_or_nbsp(text) is None:
+        return text
+    return escape_xaml(text).replace(' ', nbsp)
@@ -0,0 +1,86 @@
+"""
+Walking a docutils doctree with an explicit stack instead of recursion, so
+the depth of the tree isn't limited by the Python recursion limit.
+"""
+
+from docutils.nodes import (SkipChildren, SkipDeparture, SkipNode,
+                            SkipSiblings, StopTraversal)
+
+__all__ = ['iter_nodes', 'walkabout']
+
+
+def walkabout(node, visitor):
+    """
+    Walk the doctree `node` and call the `dispatch_visit` and
+    `dispatch_departure` methods of `visitor` for each node, as
+    ``node.walkabout(visitor)`` does, but without recursion.
+
+    The `SkipNode`, `SkipDeparture`, `SkipChildren`, `SkipSiblings` and
+    `StopTraversal` exceptions raised by the visitor have the same effect
+    as with docutils. Return True if the traversal was stopped.
+    """
+    # each entry is [node, children, index of the next child, call depart]
+    stack = []
+    stop = False
+    while True:
+        skip_siblings = False
+        entry = None
+        try:
+            try:
+                visitor.dispatch_visit(node)
+            except SkipNode:
+                pass
+            except SkipDeparture:
+                entry = [node, node.children[:], 0, False]
+            else:
+                entry = [node, node.children[:], 0, True]
+        except SkipChildren:
+            entry = [node, (), 0, True]
+        except StopTraversal:
+            entry = [node, (), 0, True]
+            stop = True
+        except SkipSiblings:
+            if not stack:
+                raise
+            skip_siblings = True
+
+        if entry is not None:
+            stack.append(entry)
+
+        # depart the nodes that are done, and find the next one to visit
+        while stack:
+            entry = stack[-1]
+            current, children, index, call_depart = entry
+            if stop or skip_siblings or index == len(children):
+                stack.pop()
+                skip_siblings = False
+                if call_depart:
+                    try:
+                        visitor.dispatch_departure(current)
+                    except SkipSiblings:
+                        if not stack:
+                            raise
+                        skip_siblings = True
+                continue
+            entry[2] = index + 1
+            node = children[index]
+            break
+        else:
+            return stop
+
+
+def iter_nodes(node, condition=None):
+    """
+    Yield `node` and all of its descendants in document order, like
+    ``node.traverse(condition)`` but without recursion. `condition` may be
+    a node class or a function.
+    """
+    if isinstance(condition, type):
+        node_class = condition
+        condition = lambda node: isinstance(node, node_class)
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if condition is None or condition(node):
+            yield node
+        stack.extend(reversed(node.children))
@@ -1,35 +1,506 @@
 
-from docutils.core import publish_string
+import copy
+
+from StringIO import StringIO
+
+from docutils import io
+from docutils.core import Publisher, publish_doctree, publish_string
+from docutils.parsers import rst
+from docutils.parsers.rst import roles, states
+from docutils.statemachine import string2lines
+from docutils.transforms import Transformer
+from docutils.utils import DependencyList, new_reporter
 from docutils.writers import Writer
-from xamlwriter.translator import XamlTranslator
+from xamlwriter.events import XamlEmitter
+from xamlwriter.highlight import highlight_code_blocks
+from xamlwriter.translator import (TeeTranslator, XamlEventTranslator,
+                                   XamlTranslator)
+from xamlwriter.walker import walkabout
 
 
 class XamlWriter(Writer):
-    """Writer to convert a docutils nodetree to a XAML nodetree."""
+    """
+    Writer to convert a docutils nodetree to a XAML nodetree.
+    
+    If `outfile` is given the XAML is written straight to it as the
+    docutils nodetree is walked, and no XAML nodetree is built.
+    
+    The writer sets the 'xaml_flowdocument' and 'xaml_style_resources'
+    settings, so that the pygments directive outputs code blocks for the
+    same mode.
     
-    def __init__(self, flowdocument=True, xclass=True):
+    With `style_resources` the Silverlight output defines named Styles once,
+    in the resources of the root StackPanel, for the attributes that would
+    otherwise be repeated on every TextBlock. The FlowDocument output
+    defines a Style for each pygments token type used by the code blocks
+    in the resources of the FlowDocument, and the Runs refer to those.
+    
+    If a `xamlwriter.nodestats.NodeStats` is passed as `node_stats` the
+    translator records per node type counts and timings in it.
+    """
+    
+    def __init__(self, flowdocument=True, xclass=True, outfile=None,
+                 style_resources=False, node_stats=None):
         self.flowdocument = flowdocument
         self.xclass = xclass
+        self.outfile = outfile
+        self.style_resources = style_resources
+        self.node_stats = node_stats
+        self.settings_default_overrides = {
+            'xaml_flowdocument': flowdocument,
+            'xaml_style_resources': style_resources,
+        }
         Writer.__init__(self)
 
     supported = ('xaml',)
     output = None
 
     def translate(self):
-        visitor = XamlTranslator(self.document, flowdocument=self.flowdocument, xclass=self.xclass)
-        self.document.walkabout(visitor)
+        if self.outfile is not None:
+            visitor = XamlEventTranslator(self.document, XamlEmitter(self.outfile),
+                                          flowdocument=self.flowdocument,
+                                          xclass=self.xclass,
+                                          style_resources=self.style_resources)
+        else:
+            visitor = XamlTranslator(self.document, flowdocument=self.flowdocument, xclass=self.xclass,
+                                     style_resources=self.style_resources)
+        if self.node_stats is not None:
+            visitor.enable_profiling(self.node_stats)
+        walkabout(self.document, visitor)
         self.output = visitor
 
 settings_overrides = {
     'file_insertion_enabled': False,
 }
 
-def publish_xaml(input_data, flowdocument=True, overrides=None, xclass=True):
+def get_config(overrides=None, store_code_blocks=None):
+    """Return the docutils settings overrides for a conversion."""
     config = settings_overrides.copy()
+    if store_code_blocks is not None:
+        config['xaml_store_code_blocks'] = store_code_blocks
     if overrides is not None:
         config.update(overrides)
+    return config
+
+def publish_xaml(input_data, flowdocument=True, overrides=None, xclass=True,
+                 outfile=None, streaming=False, cache=None,
+                 store_code_blocks=None, style_resources=False,
+                 doctree_cache=None, highlight_jobs=None, highlight_pool=None):
+    """
+    Convert the reST source `input_data` to XAML.
+
+    The XAML is returned as a string unless a file-like object is passed as
+    `outfile`, in which case it is written straight to that object (without
+    building the whole document as a string first) and None is returned.
+    
+    If `streaming` is True the XAML is written out while the docutils
+    nodetree is walked, without building a XAML nodetree first. The output
+    is the same.
+    
+    `cache` is an optional `xamlwriter.cache.RenderCache`. If the document
+    has been converted with the same options before the cached XAML is
+    used, otherwise the new XAML is stored in the cache.
+    
+    `store_code_blocks` configures the pygments directive for this call.
+    If it is None the module level default in
+    `xamlwriter.register_directive` is used.
+    
+    If `style_resources` is True the XAML uses named Style resources
+    instead of repeating the same attributes on every element (see
+    `XamlWriter`).
+    
+    `doctree_cache` is an optional `xamlwriter.cache.DoctreeCache`. The
+    parsed doctree is taken from it, or stored in it, and only written
+    here (see `get_doctree`), so converting the same source in the other
+    mode or with other writer options doesn't parse it again.
+    
+    If `highlight_jobs` is given the code blocks are highlighted after the
+    document is parsed, all together, in that many worker processes (0 for
+    one per CPU); see `xamlwriter.highlight.highlight_code_blocks`.
+    `highlight_pool` is a `multiprocessing.Pool` to use for this instead of
+    starting new processes, for callers converting many documents.
+    """
+    if cache is not None:
+        from xamlwriter.cache import render_key
+        key = render_key(input_data, flowdocument=flowdocument, xclass=xclass,
+                         overrides=overrides, store_code_blocks=store_code_blocks,
+                         style_resources=style_resources)
+        output = cache.get(key)
+        if output is None:
+            output = publish_xaml(input_data, flowdocument=flowdocument,
+                                  overrides=overrides, xclass=xclass,
+                                  streaming=streaming,
+                                  store_code_blocks=store_code_blocks,
+                                  style_resources=style_resources,
+                                  doctree_cache=doctree_cache,
+                                  highlight_jobs=highlight_jobs,
+                                  highlight_pool=highlight_pool)
+            cache.set(key, output)
+        if outfile is not None:
+            outfile.write(output)
+            return None
+        return output
+    
+    highlighting = highlight_jobs is not None or highlight_pool is not None
+    if doctree_cache is not None or highlighting:
+        document = get_doctree(input_data, overrides=overrides,
+                               store_code_blocks=store_code_blocks,
+                               cache=doctree_cache)
+        if highlighting:
+            highlight_code_blocks([document], flowdocument=flowdocument,
+                                  style_resources=style_resources,
+                                  jobs=highlight_jobs or None,
+                                  pool=highlight_pool)
+        return write_doctree(document, flowdocument=flowdocument,
+                             overrides=overrides, xclass=xclass,
+                             outfile=outfile, streaming=streaming,
+                             style_resources=style_resources)
     
-    writer = XamlWriter(flowdocument=flowdocument, xclass=xclass)
+    config = get_config(overrides, store_code_blocks)
+    
+    if streaming:
+        out = outfile
+        if out is None:
+            out = StringIO()
+        writer = XamlWriter(flowdocument=flowdocument, xclass=xclass,
+                            outfile=out, style_resources=style_resources)
+        publish_string(source=input_data, writer=writer,
+                       settings_overrides=config)
+        if outfile is not None:
+            return None
+        return out.getvalue()
+    
+    writer = XamlWriter(flowdocument=flowdocument, xclass=xclass,
+                        style_resources=style_resources)
     rv = publish_string(source=input_data, writer=writer,
                         settings_overrides=config)
-    return rv.root.to_string()
\ No newline at end of file
+    if outfile is not None:
+        rv.root.write(outfile)
+        return None
+    return rv.root.to_string()
+
+
+def get_doctree(input_data, overrides=None, store_code_blocks=None,
+                cache=None):
+    """
+    Return the parsed and transformed docutils doctree for `input_data`,
+    for `write_doctree`. Its code blocks are left as
+    `xamlwriter.highlight.code_block` nodes and highlighted when it is
+    written, so the same doctree can be written in either mode.
+    
+    `cache` is an optional `xamlwriter.cache.DoctreeCache`; the doctree is
+    taken from it if it's there, and stored in it otherwise. The code
+    blocks of a cached doctree are stored (see `store_code_blocks`) as if
+    it had been parsed.
+    """
+    if cache is not None:
+        from xamlwriter.cache import doctree_key
+        key = doctree_key(input_data, overrides=overrides,
+                          store_code_blocks=store_code_blocks)
+        document = cache.get(key)
+        if document is not None:
+            # the parser would have stored the code blocks
+            from xamlwriter.register_directive import collect_code_blocks
+            collect_code_blocks(document,
+                                (overrides or {}).get('xaml_code_blocks'))
+            return document
+    config = get_config(overrides, store_code_blocks)
+    config['xaml_defer_code_blocks'] = True
+    document = publish_doctree(input_data, settings_overrides=config)
+    if cache is not None:
+        cache.set(key, document)
+    return document
+
+
+def _set_up_doctree(document, writer, overrides):
+    """
+    Give `document` the settings and reporter for writing it with `writer`,
+    apply the transforms of the writer (`get_doctree` parses with a writer
+    that has none, so the system messages haven't been filtered or
+    collected yet) and return the destination for `writer.write`.
+    """
+    publisher = Publisher(writer=writer, destination_class=io.StringOutput)
+    publisher.set_components('standalone', 'restructuredtext', None)
+    publisher.process_programmatic_settings(None, get_config(overrides), None)
+    publisher.set_destination(None, None)
+    document.settings = publisher.settings
+    document.reporter = new_reporter(document.get('source', ''),
+                                     publisher.settings)
+    # the transforms are idempotent, so a doctree can be written repeatedly
+    document.transformer = Transformer(document)
+    document.transformer.populate_from_components(
+        (writer, publisher.destination))
+    document.transformer.apply_transforms()
+    return publisher.destination
+
+
+def write_doctree(document, flowdocument=True, overrides=None, xclass=True,
+                  outfile=None, streaming=False, style_resources=False):
+    """
+    Convert a doctree from `get_doctree` to XAML, which is returned or
+    written to `outfile` as with `publish_xaml`. The document gets new
+    settings and a new reporter for the conversion.
+    """
+    out = None
+    if streaming:
+        out = outfile
+        if out is None:
+            out = StringIO()
+    writer = XamlWriter(flowdocument=flowdocument, xclass=xclass, outfile=out,
+                        style_resources=style_resources)
+    destination = _set_up_doctree(document, writer, overrides)
+    writer.write(document, destination)
+    
+    if streaming:
+        if outfile is not None:
+            return None
+        return out.getvalue()
+    if outfile is not None:
+        writer.output.root.write(outfile)
+        return None
+    return writer.output.root.to_string()
+
+
+def write_doctree_both(document, overrides=None, xclass=True,
+                       style_resources=False):
+    """
+    Convert a doctree from `get_doctree` to both FlowDocument and
+    Silverlight XAML in one walk of the doctree (see `TeeTranslator`), and
+    return them as a tuple (flowdocument_xaml, silverlight_xaml).
+
+    Each code block is lexed once and formatted for both modes.
+    """
+    _set_up_doctree(document, XamlWriter(), overrides)
+    translators = [XamlTranslator(document, flowdocument=flowdocument,
+                                  xclass=xclass,
+                                  style_resources=style_resources)
+                   for flowdocument in (True, False)]
+    walkabout(document, TeeTranslator(document, translators))
+    return tuple(translator.root.to_string() for translator in translators)
+
+
+def publish_xaml_both(input_data, overrides=None, xclass=True,
+                      store_code_blocks=None, style_resources=False,
+                      doctree_cache=None):
+    """
+    Convert the reST source `input_data` to both FlowDocument and Silverlight
+    XAML, parsing it only once, and return (flowdocument_xaml,
+    silverlight_xaml). The arguments are those of `publish_xaml`.
+    """
+    document = get_doctree(input_data, overrides=overrides,
+                           store_code_blocks=store_code_blocks,
+                           cache=doctree_cache)
+    return write_doctree_both(document, overrides=overrides, xclass=xclass,
+                              style_resources=style_resources)
+
+
+def publish_xaml_ex(input_data, flowdocument=True, overrides=None, xclass=True,
+                    outfile=None, streaming=False, store_code_blocks=True,
+                    style_resources=False):
+    """
+    Like `publish_xaml`, but returns a tuple of (xaml, code_blocks).
+
+    `code_blocks` is a tuple with the source of each python (or pycon)
+    code block in the document, as a single string per block. The blocks
+    are collected for this call only; nothing is kept once it returns.
+    If `outfile` is given `xaml` is None.
+    """
+    code_blocks = []
+    config = {}
+    if overrides is not None:
+        config.update(overrides)
+    config['xaml_code_blocks'] = code_blocks
+    xaml = publish_xaml(input_data, flowdocument=flowdocument, overrides=config,
+                        xclass=xclass, outfile=outfile, streaming=streaming,
+                        store_code_blocks=store_code_blocks,
+                        style_resources=style_resources)
+    return xaml, tuple(code_blocks)
+
+
+def publish_xaml_timed(input_data, flowdocument=True, overrides=None,
+                       xclass=True, outfile=None, streaming=False,
+                       store_code_blocks=None, style_resources=False,
+                       node_stats=None):
+    """
+    Like `publish_xaml`, but returns a tuple of (xaml, timings), where
+    `timings` is a `xamlwriter.timings.Timings` with the time spent in each
+    phase of the conversion and highlighting each code block.
+
+    If `node_stats` is given (a `xamlwriter.nodestats.NodeStats`) the
+    translator also records per node type counts and timings in it; this
+    slows the translate phase down.
+    
+    There is no `cache` argument; the conversion is always done. If
+    `outfile` is given `xaml` is None.
+    """
+    from xamlwriter.timings import Timings
+    timings = Timings()
+    config = get_config(overrides, store_code_blocks)
+    config['xaml_timings'] = timings
+    
+    out = None
+    if streaming:
+        out = outfile
+        if out is None:
+            out = StringIO()
+    writer = XamlWriter(flowdocument=flowdocument, xclass=xclass, outfile=out,
+                        style_resources=style_resources, node_stats=node_stats)
+    
+    def setup():
+        publisher = Publisher(writer=writer, source_class=io.StringInput,
+                              destination_class=io.StringOutput)
+        publisher.set_components('standalone', 'restructuredtext', None)
+        publisher.process_programmatic_settings(None, config, None)
+        publisher.set_source(input_data, None)
+        publisher.set_destination(None, None)
+        return publisher
+    
+    publisher = timings.time('settings', setup)
+    publisher.document = timings.time('parse', publisher.reader.read,
+                                      publisher.source, publisher.parser,
+                                      publisher.settings)
+    timings.time('transforms', publisher.apply_transforms)
+    timings.time('translate', writer.write, publisher.document,
+                 publisher.destination)
+    
+    if streaming:
+        if outfile is not None:
+            return None, timings
+        return out.getvalue(), timings
+    if outfile is not None:
+        timings.time('serialize', writer.output.root.write, outfile)
+        return None, timings
+    return timings.time('serialize', writer.output.root.to_string), timings
+
+
+class ReusableParser(rst.Parser):
+    """
+    A reST parser that keeps its state machine from one document to the
+    next instead of building a new one, with all of its states and their
+    transitions, for every document. (docutils already reuses the state
+    machines for nested structures this way.)
+    """
+
+    statemachine = None
+
+    def parse(self, inputstring, document):
+        self.setup_parse(inputstring, document)
+        debug = document.reporter.debug_flag
+        statemachine = self.statemachine
+        if statemachine is None or statemachine.debug != debug:
+            statemachine = self.statemachine = states.RSTStateMachine(
+                state_classes=self.state_classes,
+                initial_state=self.initial_state, debug=debug)
+        # each run adds the document as an observer and never removes it
+        statemachine.observers = []
+        inputlines = string2lines(inputstring,
+                                  tab_width=document.settings.tab_width,
+                                  convert_whitespace=True)
+        try:
+            statemachine.run(inputlines, document, inliner=self.inliner)
+        finally:
+            statemachine.observers = []
+            statemachine.document = statemachine.reporter = None
+        # restore the "default" default role after parsing a document
+        if '' in roles._roles:
+            del roles._roles['']
+        self.finish_parse()
+
+
+class XamlPublisher(object):
+    """
+    Converts many documents with the same options, doing the docutils setup
+    (option parsing, settings, reader and parser) once instead of for every
+    call like `publish_xaml`. The arguments are those of `publish_xaml`.
+    The parser is a `ReusableParser`.
+
+    Each document gets its own copy of the settings, so nothing one
+    conversion does to them is seen by the next. A `XamlPublisher` must
+    not be used from several threads at once.
+    """
+
+    def __init__(self, flowdocument=True, overrides=None, xclass=True,
+                 streaming=False, store_code_blocks=None,
+                 style_resources=False):
+        self.streaming = streaming
+        self.writer = XamlWriter(flowdocument=flowdocument, xclass=xclass,
+                                 style_resources=style_resources)
+        publisher = Publisher(parser=ReusableParser(), writer=self.writer,
+                              source_class=io.StringInput,
+                              destination_class=io.StringOutput)
+        publisher.set_components('standalone', None, None)
+        publisher.process_programmatic_settings(
+            None, get_config(overrides, store_code_blocks), None)
+        publisher.set_destination(None, None)
+        self.reader = publisher.reader
+        self.parser = publisher.parser
+        self.destination = publisher.destination
+        self.settings = publisher.settings
+
+
+    def publish(self, input_data, outfile=None):
+        """
+        Convert the reST source `input_data` to XAML, returned as a string
+        unless it is written to `outfile`, as with `publish_xaml`.
+        """
+        return self.convert(input_data, outfile, copy.copy(self.settings))
+
+
+    def publish_ex(self, input_data, outfile=None, store_code_blocks=True):
+        """
+        Like `publish_xaml_ex`, returns a tuple of (xaml, code_blocks). The
+        code blocks are stored for this conversion whatever the publisher
+        was created with, unless `store_code_blocks` is False.
+        """
+        code_blocks = []
+        settings = copy.copy(self.settings)
+        settings.xaml_code_blocks = code_blocks
+        settings.xaml_store_code_blocks = store_code_blocks
+        xaml = self.convert(input_data, outfile, settings)
+        return xaml, tuple(code_blocks)
+
+
+    def read(self, input_data, settings=None):
+        """
+        Parse the reST source `input_data` and apply the transforms,
+        returning the docutils document without writing it.
+        """
+        if settings is None:
+            settings = copy.copy(self.settings)
+        settings.record_dependencies = DependencyList()
+        source = io.StringInput(source=input_data,
+                                source_path=settings._source,
+                                encoding=settings.input_encoding)
+        try:
+            document = self.reader.read(source, self.parser, settings)
+        finally:
+            self.reader.document = self.reader.input = None
+        document.transformer.populate_from_components(
+            (source, self.reader, self.parser, self.writer, self.destination))
+        document.transformer.apply_transforms()
+        return document
+
+
+    def convert(self, input_data, outfile, settings):
+        writer = self.writer
+        out = None
+        if self.streaming:
+            out = outfile
+            if out is None:
+                out = StringIO()
+        writer.outfile = out
+
+        document = self.read(input_data, settings)
+        try:
+            writer.write(document, self.destination)
+            if self.streaming:
+                if outfile is not None:
+                    return None
+                return out.getvalue()
+            if outfile is not None:
+                writer.output.root.write(outfile)
+                return None
+            return writer.output.root.to_string()
+        finally:
+            # don't keep the last document alive between conversions
+            writer.document = writer.output = writer.outfile = None
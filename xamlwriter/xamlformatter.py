@@ -1,43 +1,156 @@
 # a xaml formatter for pygments
 
+import re
+
 from pygments.formatter import Formatter
+from pygments.token import STANDARD_TYPES
 
-from xamlwriter.utils import escape_xaml
+from xamlwriter.utils import escape_xaml, escape_xaml_nbsp
 
 __all__ = ['XamlFormatter']
 
 
+# prefix for the keys of the Styles used for token types in resource mode
+RESOURCE_PREFIX = 't_'
+
+_resource_reference = re.compile(r'\{StaticResource (%s[^}]*)\}' % RESOURCE_PREFIX)
+
+
+def _get_ttype_class(ttype):
+    fname = STANDARD_TYPES.get(ttype)
+    if fname:
+        return fname
+    aname = ''
+    while fname is None:
+        aname = '-' + ttype[-1] + aname
+        ttype = ttype.parent
+        fname = STANDARD_TYPES.get(ttype)
+    return fname + aname
+
+
 class XamlFormatter(Formatter):
     name = 'XAML'
     aliases = ['xaml']
     filenames = ['*.xaml']
 
-    def __init__(self, flowdocument=True, store_code_blocks=False, **options):
+    # (styles, setters, start, end) for each
+    # (style, flowdocument, store_code_blocks)
+    style_tables = {}
+    
+    # the opening Run tag for each token type, for each
+    # (style, style_resources)
+    run_tables = {}
+
+    def __init__(self, flowdocument=True, store_code_blocks=False,
+                 style_resources=False, **options):
+        """
+        With `style_resources` the Runs refer to a Style resource for their
+        token type instead of setting the colour, weight and style
+        themselves, where that is shorter (see `get_style_resources`). Only
+        FlowDocument Runs can have a Style, so this does nothing for
+        Silverlight.
+        """
         Formatter.__init__(self, **options)
         self.flowdocument = flowdocument
         self.store_code_blocks = store_code_blocks
+        self.style_resources = bool(style_resources and flowdocument)
         
         self.linenos = 0
         if flowdocument:
             self.lineseparator = '\n'
         else:
             self.lineseparator = '<LineBreak />'
-        self.styles = {}
         
+        key = (self.style, flowdocument, store_code_blocks)
+        table = self.style_tables.get(key)
+        if table is None:
+            table = self.style_tables[key] = self._make_style_table()
+        self.styles, self.setters, self.start, self.end = table
+        
+        key = (self.style, self.style_resources)
+        runs = self.run_tables.get(key)
+        if runs is None:
+            runs = self.run_tables[key] = self._make_run_table()
+        self.runs = runs
+
+
+    def _make_run_table(self):
+        runs = {}
+        for ttype, format_string in self.styles.iteritems():
+            run = '<Run%s>' % format_string
+            if self.style_resources:
+                if not format_string:
+                    # unstyled text doesn't need a Run of its own
+                    run = ''
+                else:
+                    # a single colour is shorter inline than as a reference
+                    reference = '<Run Style="{StaticResource %s}">' % (
+                        RESOURCE_PREFIX + _get_ttype_class(ttype))
+                    if len(reference) < len(run):
+                        run = reference
+            runs[ttype] = run
+        return runs
+
+
+    def get_style_resources(self, xaml_fragments):
+        """
+        Return the Styles referred to by Runs in the highlighted XAML
+        `xaml_fragments`, as (key, setters) pairs sorted by key. `setters`
+        is a tuple of (property, value) pairs.
+        """
+        keys = set()
+        for xaml in xaml_fragments:
+            keys.update(_resource_reference.findall(xaml))
+        resources = []
+        for ttype, setters in self.setters.iteritems():
+            key = RESOURCE_PREFIX + _get_ttype_class(ttype)
+            if setters and key in keys:
+                resources.append((key, setters))
+        resources.sort()
+        return resources
+
+
+    def _get_run(self, ttype):
+        """
+        Return the opening Run tag for a token type that isn't in the style,
+        based on its nearest parent that is, and remember it.
+        """
+        parent = ttype
+        while parent not in self.styles:
+            parent = parent.parent
+        run = self.runs[ttype] = self.runs[parent]
+        return run
+
+
+    def _make_style_table(self):
+        styles = {}
+        setters = {}
         for token, style in self.style:
-            format_string = ''
+            attributes = []
             # a style item is a tuple in the following form:
             # colors are readily specified in hex: 'RRGGBB'
             if style['color']:
-                format_string = ' Foreground="#%s"' % style['color']
+                attributes.append(('Foreground', '#%s' % style['color']))
             if style['bold']:
-                format_string += ' FontWeight="Bold"'
+                attributes.append(('FontWeight', 'Bold'))
             if style['italic']:
-                format_string += ' FontStyle="Italic"'
+                attributes.append(('FontStyle', 'Italic'))
             if style['underline']:
                 # not used ?
                 pass
-            self.styles[token] = format_string
+            styles[token] = ''.join(' %s="%s"' % pair for pair in attributes)
+            setters[token] = tuple(attributes)
+        
+        if self.flowdocument:
+            start = '<Paragraph FontFamily="Consolas, Monaco, Lucida Console, Global Monospace" xml:space="preserve">'
+            end = '</Paragraph>'
+        else:
+            start = '<TextBlock FontFamily="Consolas, Monaco, Lucida Console, Global Monospace" FontSize="15" Margin="15,10,0,0">'
+            end = '</TextBlock>'
+            
+        if self.store_code_blocks:
+            end = end + '<Button  Margin="10,10,0,10" Padding="0" FontWeight="Bold" Height="20" FontFamily="Consolas, Monaco, Lucida Console, Global Monospace" FontSize="15" Foreground="#000080" Content="&#160;&gt;&gt;&gt;&#160;" Width="40" HorizontalAlignment="Left" />'
+        return styles, setters, start, end
 
 
     def format(self, tokensource, outfile):
@@ -54,78 +167,65 @@ class XamlFormatter(Formatter):
         use several different wrappers that process the original source
         linewise, e.g. line number generators.
         """
-        source = self._format_lines(tokensource)
+        lsep = self.lineseparator
+        write = outfile.write
         
-        if self.flowdocument:
-            start = '<Paragraph FontFamily="Consolas, Monaco, Lucida Console, Global Monospace" xml:space="preserve">'
-            end = '</Paragraph>'
-        else:
-            start = '<TextBlock FontFamily="Consolas, Monaco, Lucida Console, Global Monospace" FontSize="15" Margin="15,10,0,0">'
-            end = '</TextBlock>'
-            
-        if self.store_code_blocks:
-            end = end + '<Button  Margin="10,10,0,10" Padding="0" FontWeight="Bold" Height="20" FontFamily="Consolas, Monaco, Lucida Console, Global Monospace" FontSize="15" Foreground="#000080" Content="&#160;&gt;&gt;&gt;&#160;" Width="40" HorizontalAlignment="Left" />'
-            
-        outfile.write(start)
-        previous_piece = None
-        for t, piece in source:
-            if previous_piece is not None:
-                outfile.write(previous_piece)
-            previous_piece = piece
-        if previous_piece is not None:
-            outfile.write(previous_piece[:-len(self.lineseparator)])
-        outfile.write(end)
+        write(self.start)
+        # lines come without their separator, so it only goes between them
+        separator = ''
+        for t, line in self._format_lines(tokensource):
+            write(separator)
+            write(line)
+            separator = lsep
+        write(self.end)
             
 
     def _format_lines(self, tokensource):
         """
         Just format the tokens, without any wrapping tags.
-        Yield individual lines.
+        Yield individual lines, without the line separator.
         """
-        enc = self.encoding
-        lsep = self.lineseparator
-        
-
+        runs = self.runs
+        flowdocument = self.flowdocument
         lspan = ''
-        line = ''
+        # the fragments of the current line
+        line = []
         for ttype, value in tokensource:
-            while ttype not in self.styles:
-                ttype = ttype.parent
-
-            cspan = '<Run%s>' % self.styles[ttype]
+            cspan = runs.get(ttype)
+            if cspan is None:
+                cspan = self._get_run(ttype)
             
-            value = escape_xaml(value)
-            if not self.flowdocument:
-                value = value.replace(' ', '&#0160;')
+            if flowdocument:
+                value = escape_xaml(value)
+            else:
+                value = escape_xaml_nbsp(value, '&#0160;')
             parts = value.split('\n')
             
             # for all but the last line
             for part in parts[:-1]:
                 if line:
                     if lspan != cspan:
-                        line += (lspan and '</Run>') + cspan + part + \
-                                (cspan and '</Run>') + lsep
+                        line.extend(((lspan and '</Run>'), cspan, part,
+                                     (cspan and '</Run>')))
                     else: # both are the same
-                        line += part + (lspan and '</Run>') + lsep
-                    yield 1, line
-                    line = ''
+                        line.extend((part, (lspan and '</Run>')))
+                    yield 1, ''.join(line)
+                    del line[:]
                 elif part:
-                    yield 1, cspan + part + (cspan and '</Run>') + lsep
+                    yield 1, cspan + part + (cspan and '</Run>')
                 else:
-                    yield 1, lsep
+                    yield 1, ''
             # for the last line
             if line and parts[-1]:
                 if lspan != cspan:
-                    line += (lspan and '</Run>') + cspan + parts[-1]
+                    line.extend(((lspan and '</Run>'), cspan, parts[-1]))
                     lspan = cspan
                 else:
-                    line += parts[-1]
+                    line.append(parts[-1])
             elif parts[-1]:
-                line = cspan + parts[-1]
+                line.extend((cspan, parts[-1]))
                 lspan = cspan
             # else we neither have to open a new span nor set lspan
 
         if line:
-            yield 1, line + (lspan and '</Run>') + lsep
-            
-
+            yield 1, ''.join(line) + (lspan and '</Run>')